@@ -1,11 +1,2 @@
-import sys
-import os
-
-# Add the backend directory to the Python path
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
-
-# Import the FastAPI app from backend
-from main import app
-
-# Export the app for Vercel
-app = app
+# Import the FastAPI app from the backend package and export it for Vercel
+from backend.main import app
@@ -0,0 +1,14 @@
+"""
+Briefly backend package.
+
+The backend modules import each other by bare name (import gemini_ai) so they
+keep working when run from this directory (uvicorn main:app). When the package
+is imported instead (from backend.main import app), register this directory
+once so those sibling imports resolve to the same modules.
+"""
+import os
+import sys
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if _BACKEND_DIR not in sys.path:
+    sys.path.append(_BACKEND_DIR)
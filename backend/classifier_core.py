@@ -0,0 +1,151 @@
+"""
+Shared Gemini request pipeline for the email classifiers.
+Handles the retried Gemini call, reply decoding and error classification
+used by both gemini_ai and deal_flow_classifier.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import re
+import time
+import msgspec
+import orjson
+
+GEMINI_MODEL = "gemini-2.0-flash"
+GEMINI_MAX_ATTEMPTS = 3
+GEMINI_RETRY_MAX_DELAY = 15
+
+# Serialized empty extracted_info, shared by fallbacks and replies without one
+EMPTY_JSON = '{}'
+
+# A reply wrapped in a markdown code fence, with or without the json tag
+_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*(.*?)\s*```\s*$', re.DOTALL)
+
+# Outermost JSON object or array, for replies with prose around the payload
+_JSON_RE = re.compile(r'\{.*\}|\[.*\]', re.DOTALL)
+
+# Failures worth retrying: network hiccups, rate limits and server-side errors.
+# Bad requests, auth failures and unparseable replies fail the same way every time.
+_TRANSIENT_ERRORS = (TimeoutError, ConnectionError)
+_TRANSIENT_STATUS_RE = re.compile(r'\b(?:429|5\d\d)\b|RESOURCE_EXHAUSTED|UNAVAILABLE|DEADLINE_EXCEEDED|INTERNAL|(?i:timeout|timed out)')
+
+
+def dumps(value) -> str:
+    """Serialize a value to a JSON string for storage."""
+    return orjson.dumps(value).decode('utf-8')
+
+
+def decode_reply(response_text: str):
+    """
+    Decode the JSON payload of a Gemini reply, unwrapping a markdown fence in one match.
+    Raises orjson.JSONDecodeError if no JSON can be found.
+    """
+    fence = _FENCE_RE.match(response_text)
+    payload = fence.group(1) if fence else response_text
+    try:
+        return orjson.loads(payload)
+    except orjson.JSONDecodeError:
+        match = _JSON_RE.search(payload)
+        if match is None:
+            raise
+        return orjson.loads(match.group(0))
+
+
+def decode_reply_as(response_text: str, reply_type):
+    """
+    Decode a Gemini reply straight into a msgspec type, validating while parsing.
+    Raises msgspec.ValidationError if the JSON doesn't fit reply_type, and
+    msgspec.DecodeError if no JSON can be found.
+    """
+    fence = _FENCE_RE.match(response_text)
+    payload = fence.group(1) if fence else response_text
+    try:
+        return msgspec.json.decode(payload, type=reply_type, strict=False)
+    except msgspec.ValidationError:
+        raise
+    except msgspec.DecodeError:
+        match = _JSON_RE.search(payload)
+        if match is None:
+            raise
+        return msgspec.json.decode(match.group(0), type=reply_type, strict=False)
+
+
+def error_kind(error_msg: str) -> str:
+    """Classify a Gemini error message as 'quota', 'auth' or 'other'."""
+    if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg or "quota" in error_msg.lower():
+        return 'quota'
+    if "403" in error_msg or "PERMISSION_DENIED" in error_msg:
+        return 'auth'
+    return 'other'
+
+
+def is_transient(error: BaseException) -> bool:
+    """Return True if a failed Gemini call is worth retrying."""
+    if isinstance(error, _TRANSIENT_ERRORS):
+        return True
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code == 429 or code >= 500
+    return _TRANSIENT_STATUS_RE.search(str(error)) is not None
+
+
+def retry_delay(attempt: int) -> float:
+    """
+    Seconds to wait after a failed attempt (0-based), with full jitter: a random
+    wait up to 4s, 8s, ... capped at GEMINI_RETRY_MAX_DELAY. The jitter keeps
+    workers that hit the rate limit together from retrying in lockstep.
+    """
+    return random.uniform(0, min(GEMINI_RETRY_MAX_DELAY, 2 * 2 ** (attempt + 1)))
+
+
+def _reply_complete(parts: list[str]) -> bool:
+    """
+    Return True once the streamed text so far is a complete JSON document.
+    Parsing is only attempted when the latest chunk ends with a closing bracket.
+    """
+    if not parts[-1].rstrip().endswith(('}', ']')):
+        return False
+    try:
+        orjson.loads(''.join(parts))
+    except orjson.JSONDecodeError:
+        return False
+    return True
+
+
+def generate(client, contents: str, config: dict | None = None) -> str:
+    """
+    Stream a Gemini reply and return its text, retrying transient failures
+    with exponential backoff. Reading stops as soon as the text is a complete
+    JSON document, without waiting for the stream's closing chunk.
+    """
+    for attempt in range(GEMINI_MAX_ATTEMPTS):
+        try:
+            parts = []
+            for chunk in client.models.generate_content_stream(model=GEMINI_MODEL, contents=contents, config=config):
+                if chunk.text:
+                    parts.append(chunk.text)
+                    if _reply_complete(parts):
+                        break
+            return ''.join(parts).strip()
+        except Exception as e:
+            if attempt == GEMINI_MAX_ATTEMPTS - 1 or not is_transient(e):
+                raise
+            time.sleep(retry_delay(attempt))
+
+
+async def generate_async(client, contents: str, config: dict | None = None) -> str:
+    """Async counterpart of generate using the client's aio surface."""
+    for attempt in range(GEMINI_MAX_ATTEMPTS):
+        try:
+            parts = []
+            async for chunk in await client.aio.models.generate_content_stream(model=GEMINI_MODEL, contents=contents, config=config):
+                if chunk.text:
+                    parts.append(chunk.text)
+                    if _reply_complete(parts):
+                        break
+            return ''.join(parts).strip()
+        except Exception as e:
+            if attempt == GEMINI_MAX_ATTEMPTS - 1 or not is_transient(e):
+                raise
+            await asyncio.sleep(retry_delay(attempt))
@@ -4,8 +4,14 @@ Handles SQLite database operations for users and emails.
 """
 import sqlite3
 import os
+import atexit
+import queue
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional, List, Dict, Tuple
+from pathlib import Path
+from typing import Optional, List, Dict, Set, Tuple
 import encryption
 
 # Use script directory for database path to ensure it works regardless of where script is run from
@@ -13,70 +19,223 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(script_dir, "briefly.db")
 
 
-def get_db_connection():
-    """Create and return a database connection."""
-    conn = sqlite3.connect(DB_PATH)
+# Writes go through a single serialized connection; reads draw from a pool of
+# read-only connections that run concurrently under WAL
+READ_POOL_SIZE = os.cpu_count() or 4
+_write_conn: Optional[sqlite3.Connection] = None
+_write_lock = threading.RLock()
+_read_pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+_read_pool_opened = 0
+_read_pool_lock = threading.Lock()
+_open_connections: List[sqlite3.Connection] = []
+
+# In-memory set of stored msg_ids so ingest can skip known emails without a query.
+# Loaded once on first use and kept in sync by save_emails_bulk/delete_all_user_data.
+_known_msg_ids: Optional[Set[str]] = None
+_known_msg_ids_lock = threading.Lock()
+
+# Applied once to every new connection: NORMAL sync is safe under WAL,
+# plus a 64 MB page cache and in-memory temp tables
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+def _configure_connection(conn: sqlite3.Connection):
+    """Apply the performance PRAGMAs to a freshly opened connection."""
     conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    _open_connections.append(conn)
+
+
+def get_db_connection():
+    """
+    Return the shared writer connection, opening it on first use.
+    The writer also creates the database file and switches it to WAL mode,
+    which persists in the file and lets readers proceed during writes.
+    """
+    global _write_conn
+    with _write_lock:
+        if _write_conn is None:
+            conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            _configure_connection(conn)
+            _write_conn = conn
+        return _write_conn
+
+
+@contextmanager
+def write_connection():
+    """
+    Hold the writer connection inside a BEGIN IMMEDIATE transaction.
+    Commits on success and rolls back if the block raises.
+    """
+    with _write_lock:
+        conn = get_db_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def _open_read_connection() -> sqlite3.Connection:
+    """Open a read-only connection to the database file."""
+    # The writer creates the file and enables WAL before any reader attaches
+    get_db_connection()
+    uri = f"{Path(DB_PATH).as_uri()}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+    with _write_lock:
+        _configure_connection(conn)
     return conn
 
 
-def init_database():
-    """Initialize the database with required tables."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Users table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            role TEXT NOT NULL,
-            thesis TEXT NOT NULL,
-            name TEXT NOT NULL,
-            payment_link TEXT,
-            install_date TEXT NOT NULL,
-            created_at TEXT NOT NULL
-        )
-    """)
-    
-    # Emails table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS emails (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            msg_id TEXT UNIQUE NOT NULL,
-            user_id INTEGER NOT NULL,
-            sender TEXT NOT NULL,
-            subject TEXT,
-            body_preview TEXT,
-            summary TEXT,
-            category TEXT NOT NULL,
-            extracted_info TEXT,
-            date TEXT NOT NULL,
-            processed_at TEXT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    """)
+@contextmanager
+def read_connection():
+    """Borrow a read-only connection from the pool, growing it up to READ_POOL_SIZE."""
+    global _read_pool_opened
+    try:
+        conn = _read_pool.get_nowait()
+    except queue.Empty:
+        with _read_pool_lock:
+            can_open = _read_pool_opened < READ_POOL_SIZE
+            if can_open:
+                _read_pool_opened += 1
+        conn = _open_read_connection() if can_open else _read_pool.get()
+    try:
+        yield conn
+    finally:
+        _read_pool.put(conn)
+
+
+def close_db_connections():
+    """Close every pooled connection (called automatically at process exit)."""
+    global _write_conn, _read_pool_opened, _known_msg_ids
+    with _write_lock, _read_pool_lock:
+        while _open_connections:
+            _open_connections.pop().close()
+        _write_conn = None
+        _read_pool_opened = 0
+        while not _read_pool.empty():
+            _read_pool.get_nowait()
+        _known_msg_ids = None
+
+
+atexit.register(close_db_connections)
+
+
+EMAILS_TABLE_SQL = """
+    CREATE TABLE {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        msg_id TEXT UNIQUE NOT NULL,
+        user_id INTEGER NOT NULL,
+        sender TEXT NOT NULL,
+        subject TEXT,
+        body_preview TEXT,
+        summary TEXT,
+        category TEXT NOT NULL,
+        extracted_info TEXT,
+        date TEXT NOT NULL,
+        processed_at TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )
+"""
+
+
+def _migrate_emails_cascade(cursor):
+    """
+    Rebuild an emails table created before its foreign key cascaded deletes.
+    SQLite cannot alter a constraint in place, so the rows are copied into a
+    fresh table. Emails whose user no longer exists cannot satisfy the foreign
+    key; they are moved to emails_orphaned instead of being deleted.
+    """
+    foreign_keys = cursor.execute("PRAGMA foreign_key_list(emails)").fetchall()
+    if all(fk["on_delete"] == "CASCADE" for fk in foreign_keys):
+        return
     
-    # Create index on msg_id for faster lookups
-    cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_msg_id ON emails(msg_id)
-    """)
+    orphaned = cursor.execute("""
+        SELECT COUNT(*) FROM emails WHERE user_id NOT IN (SELECT id FROM users)
+    """).fetchone()[0]
+    if orphaned:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS emails_orphaned AS
+            SELECT * FROM emails WHERE 0
+        """)
+        cursor.execute("""
+            INSERT INTO emails_orphaned
+            SELECT * FROM emails WHERE user_id NOT IN (SELECT id FROM users)
+        """)
+        print(f"Database migration: Moved {orphaned} email(s) with no matching user to emails_orphaned")
     
-    # Create index on date for faster date queries
+    cursor.execute(EMAILS_TABLE_SQL.format(name="emails_migrated"))
     cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_date ON emails(date)
+        INSERT INTO emails_migrated
+        SELECT * FROM emails WHERE user_id IN (SELECT id FROM users)
     """)
+    cursor.execute("DROP TABLE emails")
+    cursor.execute("ALTER TABLE emails_migrated RENAME TO emails")
+
+
+def init_database():
+    """Initialize the database with required tables."""
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        
+        # Users table
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                role TEXT NOT NULL,
+                thesis TEXT NOT NULL,
+                name TEXT NOT NULL,
+                payment_link TEXT,
+                install_date TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        """)
+        
+        # Emails table
+        cursor.execute(EMAILS_TABLE_SQL.format(name="IF NOT EXISTS emails"))
+        _migrate_emails_cascade(cursor)
+        
+        # Create index on msg_id for faster lookups
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_msg_id ON emails(msg_id)
+        """)
+        
+        # Composite indexes matching the hot per-user queries:
+        # (user_id, date) serves date lookups and the unique-date listing,
+        # (user_id, category, date) serves category pages and covers get_email_stats
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_user_date ON emails(user_id, date DESC)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_user_cat_date ON emails(user_id, category, date DESC)
+        """)
+        
+        # Superseded by the composite indexes above
+        cursor.execute("DROP INDEX IF EXISTS idx_date")
+        cursor.execute("DROP INDEX IF EXISTS idx_user_category")
+        
+        # Refresh planner statistics so the composite indexes get picked
+        cursor.execute("ANALYZE emails")
     
-    conn.commit()
-    conn.close()
+    # Warm the msg_id set so the first ingest pass doesn't pay for it
+    _get_known_msg_ids()
 
 
 def get_user() -> Optional[Dict]:
     """Get the first (and only) user from the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users ORDER BY id LIMIT 1")
-    row = cursor.fetchone()
-    conn.close()
+    with read_connection() as conn:
+        row = conn.execute("SELECT * FROM users ORDER BY id LIMIT 1").fetchone()
     
     if row:
         return dict(row)
@@ -85,77 +244,175 @@ def get_user() -> Optional[Dict]:
 
 def create_user(role: str, thesis: str, name: str, payment_link: str = "") -> int:
     """Create a new user and return the user ID."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     now = datetime.now().isoformat()
     
-    cursor.execute("""
-        INSERT INTO users (role, thesis, name, payment_link, install_date, created_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (role, thesis, name, payment_link, now, now))
+    with write_connection() as conn:
+        cursor = conn.execute("""
+            INSERT INTO users (role, thesis, name, payment_link, install_date, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (role, thesis, name, payment_link, now, now))
     
     user_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
     return user_id
 
 
 def update_user_thesis(user_id: int, thesis: str):
     """Update user's thesis."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET thesis = ? WHERE id = ?", (thesis, user_id))
-    conn.commit()
-    conn.close()
+    with write_connection() as conn:
+        conn.execute("UPDATE users SET thesis = ? WHERE id = ?", (thesis, user_id))
+
+
+def _get_known_msg_ids() -> Set[str]:
+    """Return the set of stored msg_ids, loading it from the database on first use."""
+    global _known_msg_ids
+    if _known_msg_ids is None:
+        with _known_msg_ids_lock:
+            if _known_msg_ids is None:
+                with read_connection() as conn:
+                    _known_msg_ids = {row[0] for row in conn.execute("SELECT msg_id FROM emails")}
+    return _known_msg_ids
 
 
 def email_exists(msg_id: str) -> bool:
     """Check if an email with the given msg_id already exists."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM emails WHERE msg_id = ?", (msg_id,))
-    exists = cursor.fetchone() is not None
-    conn.close()
-    return exists
+    return msg_id in _get_known_msg_ids()
 
 
-def save_email(msg_id: str, user_id: int, sender: str, subject: str, 
-               body_preview: str, summary: str, category: str, 
-               extracted_info: str, date: str):
-    """Save an analyzed email to the database with encryption for sensitive fields."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    processed_at = datetime.now().isoformat()
-    
-    # Encrypt sensitive fields before saving
+# Kept as a constant so SQLite's statement cache reuses the compiled INSERT;
+# OR IGNORE skips emails that are already stored
+INSERT_EMAIL_SQL = """
+    INSERT OR IGNORE INTO emails (msg_id, user_id, sender, subject, body_preview,
+                                  summary, category, extracted_info, date, processed_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Number of rows written per transaction by save_emails_bulk
+BULK_INSERT_BATCH_SIZE = 200
+
+
+def _encrypt_email_rows(rows: List[Tuple], processed_at: str) -> List[Tuple]:
+    """Encrypt the sensitive fields of save_emails_bulk rows column by column and append processed_at."""
     try:
-        encrypted_subject = encryption.encrypt_text(subject) if subject else None
-        encrypted_body_preview = encryption.encrypt_text(body_preview) if body_preview else None
-        encrypted_summary = encryption.encrypt_text(summary) if summary else None
+        subjects, body_previews, summaries = (
+            encryption.encrypt_many([row[index] for row in rows]) for index in (3, 4, 5)
+        )
     except Exception as e:
         # If encryption fails, log error but don't save sensitive data
-        print(f"Encryption error: Failed to encrypt email data for msg_id: {msg_id[:20]}...")
+        print(f"Encryption error: Failed to encrypt email data for {len(rows)} email(s)")
         raise
+    return [
+        (msg_id, user_id, sender, subject or None, body_preview or None,
+         summary or None, category, extracted_info, date, processed_at)
+        for (msg_id, user_id, sender, _, _, _, category, extracted_info, date), subject, body_preview, summary
+        in zip(rows, subjects, body_previews, summaries)
+    ]
+
+
+def save_emails_bulk(rows: List[Tuple]):
+    """
+    Save many analyzed emails at once, encrypting sensitive fields.
+    
+    Args:
+        rows: Tuples of (msg_id, user_id, sender, subject, body_preview,
+              summary, category, extracted_info, date), in save_email order
+    """
+    processed_at = datetime.now().isoformat()
+    encrypted_rows = _encrypt_email_rows(rows, processed_at)
     
+    known_msg_ids = _get_known_msg_ids()
+    for start in range(0, len(encrypted_rows), BULK_INSERT_BATCH_SIZE):
+        batch = encrypted_rows[start:start + BULK_INSERT_BATCH_SIZE]
+        try:
+            with write_connection() as conn:
+                conn.executemany(INSERT_EMAIL_SQL, batch)
+        except sqlite3.IntegrityError:
+            # A row references a missing user; retry the batch without those rows
+            batch = _drop_rows_without_user(batch)
+            with write_connection() as conn:
+                conn.executemany(INSERT_EMAIL_SQL, batch)
+        known_msg_ids.update(row[0] for row in batch)
+
+
+def _drop_rows_without_user(rows: List[Tuple]) -> List[Tuple]:
+    """Return the rows whose user_id exists, skipping (and reporting) the rest."""
+    user_ids = {row[1] for row in rows}
+    with read_connection() as conn:
+        existing = {
+            row[0] for row in conn.execute(
+                f"SELECT id FROM users WHERE id IN ({','.join('?' * len(user_ids))})", tuple(user_ids)
+            )
+        }
+    kept = [row for row in rows if row[1] in existing]
+    if len(kept) < len(rows):
+        print(f"Database error: Skipped {len(rows) - len(kept)} email(s) for users that do not exist "
+              f"(user_id: {', '.join(str(user_id) for user_id in sorted(user_ids - existing))})")
+    return kept
+
+
+def save_email(msg_id: str, user_id: int, sender: str, subject: str, 
+               body_preview: str, summary: str, category: str, 
+               extracted_info: str, date: str):
+    """Save an analyzed email to the database with encryption for sensitive fields."""
+    save_emails_bulk([(msg_id, user_id, sender, subject, body_preview,
+                       summary, category, extracted_info, date)])
+
+
+# Email columns stored encrypted at rest
+ENCRYPTED_EMAIL_FIELDS = ('subject', 'body_preview', 'summary')
+
+
+@dataclass
+class EmailDTO:
+    """A stored email with its sensitive fields decrypted."""
+    __slots__ = ('id', 'msg_id', 'user_id', 'sender', 'subject', 'body_preview',
+                 'summary', 'category', 'extracted_info', 'date', 'processed_at')
+    id: int
+    msg_id: str
+    user_id: int
+    sender: str
+    subject: Optional[str]
+    body_preview: Optional[str]
+    summary: Optional[str]
+    category: str
+    extracted_info: Optional[str]
+    date: str
+    processed_at: str
+
+
+def _decrypt_column(rows: List[sqlite3.Row], field: str) -> List[Optional[str]]:
+    """Decrypt one encrypted column for every row in a single batch."""
+    values = [row[field] for row in rows]
     try:
-        cursor.execute("""
-            INSERT INTO emails (msg_id, user_id, sender, subject, body_preview, 
-                              summary, category, extracted_info, date, processed_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (msg_id, user_id, sender, encrypted_subject, encrypted_body_preview, 
-              encrypted_summary, category, extracted_info, date, processed_at))
-        conn.commit()
-    except sqlite3.IntegrityError:
-        # Email already exists, skip
-        pass
-    finally:
-        conn.close()
+        return encryption.decrypt_many(values)
+    except Exception as e:
+        # If decryption fails, log but continue with the stored values
+        print(f"Decryption error: Failed to decrypt email {field} for {len(rows)} row(s)")
+        return values
+
+
+def _decrypt_email_rows(rows: List[sqlite3.Row]) -> List[EmailDTO]:
+    """Build EmailDTOs straight from the rows, decrypting sensitive columns in batches."""
+    subjects, body_previews, summaries = (_decrypt_column(rows, field) for field in ENCRYPTED_EMAIL_FIELDS)
+    return [
+        EmailDTO(
+            id=row['id'],
+            msg_id=row['msg_id'],
+            user_id=row['user_id'],
+            sender=row['sender'],
+            subject=subject,
+            body_preview=body_preview,
+            summary=summary,
+            category=row['category'],
+            extracted_info=row['extracted_info'],
+            date=row['date'],
+            processed_at=row['processed_at'],
+        )
+        for row, subject, body_preview, summary in zip(rows, subjects, body_previews, summaries)
+    ]
 
 
-def get_emails_by_category(user_id: int, categories: List[str], limit: int = 100) -> List[Dict]:
+def get_emails_by_category(user_id: int, categories: List[str], limit: int = 100) -> List[EmailDTO]:
     """Get emails by category for a user, decrypting sensitive fields."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     placeholders = ','.join(['?'] * len(categories))
     query = f"""
         SELECT * FROM emails 
@@ -163,92 +420,48 @@ def get_emails_by_category(user_id: int, categories: List[str], limit: int = 100
         ORDER BY date DESC
         LIMIT ?
     """
-    cursor.execute(query, [user_id] + categories + [limit])
-    rows = cursor.fetchall()
-    conn.close()
+    with read_connection() as conn:
+        rows = conn.execute(query, [user_id] + categories + [limit]).fetchall()
     
-    # Decrypt sensitive fields
-    emails = []
-    for row in rows:
-        email_dict = dict(row)
-        try:
-            if email_dict.get('subject'):
-                email_dict['subject'] = encryption.decrypt_text(email_dict['subject'])
-            if email_dict.get('body_preview'):
-                email_dict['body_preview'] = encryption.decrypt_text(email_dict['body_preview'])
-            if email_dict.get('summary'):
-                email_dict['summary'] = encryption.decrypt_text(email_dict['summary'])
-        except Exception as e:
-            # If decryption fails, log but continue
-            print(f"Decryption error: Failed to decrypt email data for msg_id: {email_dict.get('msg_id', 'unknown')[:20]}...")
-        emails.append(email_dict)
-    
-    return emails
+    return _decrypt_email_rows(rows)
 
 
-def get_emails_by_date(user_id: int, date: str) -> List[Dict]:
+def get_emails_by_date(user_id: int, date: str) -> List[EmailDTO]:
     """Get emails for a specific date, decrypting sensitive fields."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT * FROM emails 
-        WHERE user_id = ? AND date = ?
-        ORDER BY date DESC
-    """, (user_id, date))
-    rows = cursor.fetchall()
-    conn.close()
-    
-    # Decrypt sensitive fields
-    emails = []
-    for row in rows:
-        email_dict = dict(row)
-        try:
-            if email_dict.get('subject'):
-                email_dict['subject'] = encryption.decrypt_text(email_dict['subject'])
-            if email_dict.get('body_preview'):
-                email_dict['body_preview'] = encryption.decrypt_text(email_dict['body_preview'])
-            if email_dict.get('summary'):
-                email_dict['summary'] = encryption.decrypt_text(email_dict['summary'])
-        except Exception as e:
-            # If decryption fails, log but continue
-            print(f"Decryption error: Failed to decrypt email data for msg_id: {email_dict.get('msg_id', 'unknown')[:20]}...")
-        emails.append(email_dict)
+    with read_connection() as conn:
+        rows = conn.execute("""
+            SELECT * FROM emails 
+            WHERE user_id = ? AND date = ?
+            ORDER BY date DESC
+        """, (user_id, date)).fetchall()
     
-    return emails
+    return _decrypt_email_rows(rows)
 
 
 def get_unique_dates(user_id: int) -> List[str]:
     """Get all unique dates from emails for a user."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT DISTINCT date FROM emails 
-        WHERE user_id = ?
-        ORDER BY date DESC
-    """, (user_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    with read_connection() as conn:
+        # GROUP BY walks idx_user_date as a covering index, one step per date
+        rows = conn.execute("""
+            SELECT date FROM emails 
+            WHERE user_id = ?
+            GROUP BY date
+            ORDER BY date DESC
+        """, (user_id,)).fetchall()
     return [row[0] for row in rows]
 
 
 def get_email_stats(user_id: int) -> Dict:
     """Get email statistics for a user."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Total processed
-    cursor.execute("SELECT COUNT(*) FROM emails WHERE user_id = ?", (user_id,))
-    total_processed = cursor.fetchone()[0]
-    
-    # Deals found (MATCH category)
-    cursor.execute("SELECT COUNT(*) FROM emails WHERE user_id = ? AND category = 'MATCH'", (user_id,))
-    deals_found = cursor.fetchone()[0]
-    
-    # Critical emails
-    cursor.execute("SELECT COUNT(*) FROM emails WHERE user_id = ? AND category = 'CRITICAL'", (user_id,))
-    critical_count = cursor.fetchone()[0]
-    
-    conn.close()
+    # One pass over the user's rows; the comparisons evaluate to 0/1
+    with read_connection() as conn:
+        row = conn.execute("""
+            SELECT COUNT(*),
+                   COALESCE(SUM(category = 'MATCH'), 0),
+                   COALESCE(SUM(category = 'CRITICAL'), 0)
+            FROM emails WHERE user_id = ?
+        """, (user_id,)).fetchone()
+    total_processed, deals_found, critical_count = row
     
     return {
         "total_processed": total_processed,
@@ -259,38 +472,36 @@ def get_email_stats(user_id: int) -> Dict:
 
 def get_all_users() -> List[Dict]:
     """Get all users (admin only)."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users")
-    rows = cursor.fetchall()
-    conn.close()
+    with read_connection() as conn:
+        rows = conn.execute("SELECT * FROM users").fetchall()
     return [dict(row) for row in rows]
 
 
+PLAN_PRICING = {
+    "Standard Plan ($29/mo)": 29.0,
+    "Investor Plan ($49/mo)": 49.0,
+    # Legacy support for old role names
+    "Investor ($49)": 49.0,
+    "Agency Owner ($29)": 29.0,
+    "Influencer ($29)": 29.0,
+    "Business Owner ($29)": 29.0
+}
+
+# Sum every user's plan price in SQLite instead of looping over roles in Python
+MRR_SQL = (
+    "SELECT COALESCE(SUM(CASE role "
+    + " ".join("WHEN ? THEN ?" for _ in PLAN_PRICING)
+    + " ELSE 0 END), 0) FROM users"
+)
+MRR_PARAMS = tuple(value for item in PLAN_PRICING.items() for value in item)
+
+
 def calculate_mrr() -> float:
     """Calculate total MRR from all users (admin only)."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT role FROM users")
-    rows = cursor.fetchall()
-    conn.close()
+    with read_connection() as conn:
+        mrr = conn.execute(MRR_SQL, MRR_PARAMS).fetchone()[0]
     
-    pricing = {
-        "Standard Plan ($29/mo)": 29.0,
-        "Investor Plan ($49/mo)": 49.0,
-        # Legacy support for old role names
-        "Investor ($49)": 49.0,
-        "Agency Owner ($29)": 29.0,
-        "Influencer ($29)": 29.0,
-        "Business Owner ($29)": 29.0
-    }
-    
-    mrr = 0.0
-    for row in rows:
-        role = row[0]
-        mrr += pricing.get(role, 0.0)
-    
-    return mrr
+    return float(mrr)
 
 
 def delete_all_user_data(user_id: int) -> bool:
@@ -304,25 +515,19 @@ def delete_all_user_data(user_id: int) -> bool:
     Returns:
         True if deletion was successful, False otherwise
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     try:
-        # Delete all emails for this user
-        cursor.execute("DELETE FROM emails WHERE user_id = ?", (user_id,))
-        emails_deleted = cursor.rowcount
-        
-        # Delete the user record
-        cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
-        user_deleted = cursor.rowcount
-        
-        conn.commit()
-        conn.close()
+        with write_connection() as conn:
+            deleted_msg_ids = [row[0] for row in conn.execute(
+                "SELECT msg_id FROM emails WHERE user_id = ?", (user_id,)
+            )]
+            
+            # Delete the user record; their emails go with it via ON DELETE CASCADE
+            cursor = conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+            user_deleted = cursor.rowcount
         
+        _get_known_msg_ids().difference_update(deleted_msg_ids)
         return user_deleted > 0
     except Exception as e:
-        conn.rollback()
-        conn.close()
         print(f"Database error: Failed to delete user data (user_id: {user_id})")
         return False
 
@@ -2,12 +2,23 @@
 Briefly AI Email Analysis Engine.
 Implements intelligent email prioritization, summarization, and reply-drafting based on user context.
 """
-import json
-from typing import Dict, List, Optional
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import re
+import threading
+import msgspec
+import orjson
+from collections import OrderedDict
+from typing import Any, Optional
 from enum import Enum
+from functools import lru_cache
+from types import MappingProxyType
 import gemini_ai
 import logging
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from classifier_core import (EMPTY_JSON, decode_reply, decode_reply_as, dumps, error_kind,
+                             generate, generate_async)
 
 # Initialize logger
 logger = logging.getLogger("uvicorn")
@@ -28,59 +39,103 @@ class ImportanceLevel(str, Enum):
     LOW_PRIORITY = "⚪ Low priority — optional"
 
 
-def analyze_email_briefly_ai(
-    email_content: str,
-    user_profile: Dict,
-    pdf_analysis_allowed: bool = False
-) -> Dict:
-    """
-    Briefly AI Email Analysis Engine.
-    Implements intelligent prioritization, summarization, and reply-drafting based on user context.
-
-    Args:
-        email_content: The email content to analyze
-        user_profile: Dictionary containing user's persona data:
-            - role: User's professional role
-            - current_focus: List of current priorities
-            - critical_categories: List of categories that are critical
-            - communication_style: Preferred communication style
-            - business_context: Business goals and context
-        pdf_analysis_allowed: Whether advanced PDF analysis is enabled
-
-    Returns:
-        {
-            'importance_level': ImportanceLevel enum value,
-            'summary': str (1-3 sentence executive summary),
-            'action_required': str,
-            'deadlines': str,
-            'risks_leverage': str,
-            'sender_goals': str,
-            'urgency_signals': str,
-            'reply_draft': str (if appropriate),
-            'extracted_info': dict
+# Each valid importance level -> (legacy category, score for sorting; higher = more important)
+_LEVEL_MAPPING = MappingProxyType({
+    ImportanceLevel.CRITICAL.value: ('CRITICAL', 9),
+    ImportanceLevel.IMPORTANT.value: ('HIGH', 7),
+    ImportanceLevel.USEFUL.value: ('STANDARD', 5),
+    ImportanceLevel.LOW_PRIORITY.value: ('LOW', 2)
+})
+
+# Maximum number of emails sent to Gemini in one batched request, and the
+# rough limit on email characters per request so long emails get smaller batches
+BATCH_SIZE = 5
+BATCH_CHAR_BUDGET = 30000
+
+# Successful analyses are reused for identical (email, persona) pairs, e.g. on rescans
+RESPONSE_CACHE_SIZE = 4096
+_response_cache: OrderedDict[tuple, dict] = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+# Long emails and forwarded threads are cut to their first and last characters
+# before prompting; the opening and the signature carry what ranking needs
+EMAIL_HEAD_CHARS = 6000
+EMAIL_TAIL_CHARS = 1500
+
+# Domains of bulk-mail platforms. Emails sent from one, or linking to one in
+# their first or last _NOISE_SCAN_CHARS characters (where unsubscribe footers
+# sit), are newsletters or campaigns. Unless they look transactional or mention
+# one of the user's focus areas or critical categories, they are ranked low
+# priority without calling Gemini. Generic words such as "unsubscribe" or
+# "no-reply" are not used: security alerts, payment failures and signature
+# requests come from no-reply senders too.
+_BULK_SENDER_RE = re.compile(
+    r'[@./](?:mcsv\.net|mcdlv\.net|mailchimpapp\.net|list-manage\.com|ccsend\.com|constantcontact\.com'
+    r'|createsend\.com|substack\.com|beehiiv\.com|convertkit\.com|mailerlite\.com|klaviyomail\.com'
+    r'|hubspotemail\.net|sendinblue\.com)\b',
+    re.IGNORECASE
+)
+# Transactional and security mail always goes to Gemini, whoever sent it
+_TRANSACTIONAL_RE = re.compile(
+    r'\b(?:password|security|suspicious|unusual activity|sign[- ]?in|log[- ]?in|verif(?:y|ication)'
+    r'|one[- ]time|two[- ]factor|2fa|invoice|payment|billing|receipt|refund|declined|overdue|past due'
+    r'|e-?signature|docusign|signature request|sign the document)\b',
+    re.IGNORECASE
+)
+_NOISE_SCAN_CHARS = 2048
+
+# Response schemas for Gemini's JSON mode, mirroring the OUTPUT REQUIREMENTS in the prompt.
+# Decoding is constrained to them, so replies arrive as bare JSON with every field present.
+_STRING_SCHEMA = {'type': 'STRING'}
+_REPLY_PROPERTIES = {
+    'matches_user_profile': {'type': 'BOOLEAN'},
+    'match_reasoning': _STRING_SCHEMA,
+    'importance_level': {'type': 'STRING', 'enum': [level.value for level in ImportanceLevel]},
+    'executive_summary': _STRING_SCHEMA,
+    'action_required': _STRING_SCHEMA,
+    'deadlines': _STRING_SCHEMA,
+    'risks_leverage': _STRING_SCHEMA,
+    'sender_goals': _STRING_SCHEMA,
+    'urgency_signals': _STRING_SCHEMA,
+    'reply_draft': _STRING_SCHEMA,
+    'extracted_info': {
+        'type': 'OBJECT',
+        'properties': {
+            'money_amounts': _STRING_SCHEMA,
+            'important_links': {'type': 'ARRAY', 'items': _STRING_SCHEMA},
+            'key_contacts': _STRING_SCHEMA,
+            'attachments_insights': _STRING_SCHEMA
         }
-    """
-    client = gemini_ai.get_genai_client()
-
-    # Extract persona data with defaults
-    role = user_profile.get('role', 'Professional')
-    current_focus = user_profile.get('current_focus', [])
-    critical_categories = user_profile.get('critical_categories', [])
-    communication_style = user_profile.get('communication_style', 'Professional')
-    business_context = user_profile.get('business_context', '')
-
-    # Normalize role for display
-    role_display = role if isinstance(role, str) else role.value
-
-    prompt = f"""You are Briefly AI, an intelligent email prioritization assistant for a {role_display}.
+    }
+}
+_REPLY_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': _REPLY_PROPERTIES,
+    'required': list(_REPLY_PROPERTIES)
+}
+_BATCH_REPLY_SCHEMA = {
+    'type': 'ARRAY',
+    'items': {
+        'type': 'OBJECT',
+        'properties': {'email_index': {'type': 'INTEGER'}, **_REPLY_PROPERTIES},
+        'required': ['email_index', *_REPLY_PROPERTIES]
+    }
+}
+
+# Shared request configs; treated as read-only
+_REPLY_CONFIG = {'response_mime_type': 'application/json', 'response_schema': _REPLY_SCHEMA}
+_BATCH_REPLY_CONFIG = {'response_mime_type': 'application/json', 'response_schema': _BATCH_REPLY_SCHEMA}
+
+# Persona prompt instructions; rendered once per profile by _build_prompt_parts
+_BRIEFLY_PROMPT_TEMPLATE = """You are Briefly AI, an intelligent email prioritization assistant for a {role_display}.
 Your mission is to perform deep intent analysis to identify priority communications WITHOUT relying on specific keyword matches.
 
 USER PERSONA & CONTEXT:
 - **Role:** {role_display}
-- **Top Priorities (Current Focus):** {', '.join(current_focus) if current_focus else 'General productivity and business growth'}
-- **Non-Missable Categories:** {', '.join(critical_categories) if critical_categories else 'Any high-stakes or time-sensitive communications'}
+- **Top Priorities (Current Focus):** {current_focus}
+- **Non-Missable Categories:** {critical_categories}
 - **Communication Style:** {communication_style}
-- **Business Context:** {business_context if business_context else 'Professional business environment'}
+- **Business Context:** {business_context}
 
 ANALYSIS PRINCIPLES (STRICT):
 1. **NO KEYWORD MATCHING:** Do not look for specific words. Focus on the **intent**, **logic**, and **business implications** of the message.
@@ -99,8 +154,8 @@ Rank the email into one of these EXACT categories based on business impact and d
 PROFILE MATCHING CRITERIA:
 An email MATCHES the user's profile if ANY of the following are true:
 - It directly relates to their professional role ({role_display})
-- It aligns with their current focus areas: {', '.join(current_focus) if current_focus else 'General productivity'}
-- It falls into their non-missable categories: {', '.join(critical_categories) if critical_categories else 'High-stakes communications'}
+- It aligns with their current focus areas: {focus_areas}
+- It falls into their non-missable categories: {non_missable}
 - It could impact their business goals or professional success
 - It requires a decision or action from someone in their role
 
@@ -111,14 +166,11 @@ An email DOES NOT MATCH if:
 - It has no business relevance to their stated context
 
 DOCUMENT & ATTACHMENT ANALYSIS:
-{'[ENABLED] - Thoroughly analyze pitch decks, contracts, and attachments for decision-relevant insights only. Ignore marketing fluff.' if pdf_analysis_allowed else '[DISABLED] - Do not analyze attachments.'}
-
-EMAIL CONTENT:
-{email_content}
+{attachments}
 
 OUTPUT REQUIREMENTS (JSON ONLY):
-Return a JSON object with this exact structure:
-{{
+{output_intro}
+{{{index_field}
     "matches_user_profile": true or false,
     "match_reasoning": "Brief explanation of why this email does or does not match the user's profile",
     "importance_level": "🔴 Critical — act now" | "🟠 Important — review today" | "🟡 Useful — review later" | "⚪ Low priority — optional",
@@ -137,183 +189,578 @@ Return a JSON object with this exact structure:
     }}
 }}
 
-Return ONLY the JSON object."""
+{output_outro}"""
+
+_ATTACHMENTS_ENABLED = '[ENABLED] - Thoroughly analyze pitch decks, contracts, and attachments for decision-relevant insights only. Ignore marketing fluff.'
+_ATTACHMENTS_DISABLED = '[DISABLED] - Do not analyze attachments.'
+
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-        retry=retry_if_exception_type(Exception),
-        reraise=True
+@lru_cache(maxsize=256)
+def _render_persona(
+    role_display: str,
+    current_focus: tuple[str, ...],
+    critical_categories: tuple[str, ...],
+    communication_style: str,
+    business_context: str
+) -> MappingProxyType:
+    """
+    Render the persona fields of the prompt template once per profile, so the
+    single and batched prompt variants share the joined focus and category lists.
+    """
+    focus = ', '.join(current_focus)
+    categories = ', '.join(critical_categories)
+    return MappingProxyType({
+        'role_display': role_display,
+        'current_focus': focus if current_focus else 'General productivity and business growth',
+        'critical_categories': categories if critical_categories else 'Any high-stakes or time-sensitive communications',
+        'communication_style': communication_style,
+        'business_context': business_context if business_context else 'Professional business environment',
+        'focus_areas': focus if current_focus else 'General productivity',
+        'non_missable': categories if critical_categories else 'High-stakes communications',
+    })
+
+
+@lru_cache(maxsize=256)
+def _build_prompt_parts(
+    role_display: str,
+    current_focus: tuple[str, ...],
+    critical_categories: tuple[str, ...],
+    communication_style: str,
+    business_context: str,
+    pdf_analysis_allowed: bool,
+    batched: bool = False
+) -> tuple[str, str]:
+    """
+    Build the persona-specific prompt instructions.
+    Cached per profile so an inbox scan for one user renders it only once.
+    With batched=True the prompt asks for a JSON array covering several
+    emails, each introduced by a ---EMAIL n--- marker.
+
+    Returns:
+        (instructions, emails_header) - the email content goes last, after
+        emails_header, so the instructions form a fixed prefix per profile
+    """
+    if batched:
+        emails_header = "EMAILS (each one starts with a ---EMAIL n--- marker):"
+        output_intro = "Return a JSON array with one object per email, in the same order, each with this exact structure:"
+        index_field = '\n    "email_index": n from the ---EMAIL n--- marker,'
+        output_outro = "Return ONLY the JSON array."
+    else:
+        emails_header = "EMAIL CONTENT:"
+        output_intro = "Return a JSON object with this exact structure:"
+        index_field = ""
+        output_outro = "Return ONLY the JSON object."
+
+    instructions = _BRIEFLY_PROMPT_TEMPLATE.format(
+        **_render_persona(role_display, current_focus, critical_categories, communication_style, business_context),
+        attachments=_ATTACHMENTS_ENABLED if pdf_analysis_allowed else _ATTACHMENTS_DISABLED,
+        output_intro=output_intro,
+        index_field=index_field,
+        output_outro=output_outro
     )
-    def call_gemini():
-        logger.info(f"[Briefly AI] Analyzing email for {role_display}...")
-        return client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt
+    return instructions, emails_header
+
+
+class BrieflyReply(msgspec.Struct):
+    """One analysis as returned by Gemini, with defaults for omitted fields."""
+    # msgspec evaluates these at runtime, so no `X | None` until Python 3.10
+    importance_level: Any = None
+    matches_user_profile: Optional[bool] = False
+    match_reasoning: Optional[str] = ''
+    executive_summary: Optional[str] = 'Email analyzed'
+    action_required: Optional[str] = 'No immediate action required'
+    deadlines: Optional[str] = 'No deadlines'
+    risks_leverage: Optional[str] = 'No significant risks or leverage points identified'
+    sender_goals: Optional[str] = 'General communication'
+    urgency_signals: Optional[str] = 'Standard priority'
+    reply_draft: Optional[str] = ''
+    extracted_info: Optional[dict[str, Any]] = {}
+
+
+def _normalize_result(parsed: Any) -> dict:
+    """
+    Validate one parsed Gemini analysis (a dict or an already decoded BrieflyReply)
+    and add the legacy compatibility fields.
+    Raises msgspec.ValidationError if the reply doesn't fit BrieflyReply.
+    """
+    result = msgspec.structs.asdict(msgspec.convert(parsed, BrieflyReply, strict=False))
+
+    # Validate importance level and look up its category and score in one go
+    level = result['importance_level']
+    mapping = _LEVEL_MAPPING.get(level) if isinstance(level, str) else None
+    if mapping is None:
+        # Default to low priority if unclear
+        result['importance_level'] = ImportanceLevel.LOW_PRIORITY.value
+        mapping = _LEVEL_MAPPING[ImportanceLevel.LOW_PRIORITY.value]
+        logger.warning("[Briefly AI] Invalid importance level, defaulting to LOW_PRIORITY")
+    category, score = mapping
+
+    # Determine lane based on profile matching (NOT priority)
+    # - "priority_inbox" = emails that match user's profile/priorities
+    # - "everything_else" = emails that don't match user's profile
+    matches_profile = result['matches_user_profile']
+
+    # Also support old lane values for backwards compatibility with existing database records
+    lane = 'priority_inbox' if matches_profile else 'everything_else'
+
+    # Add legacy compatibility fields
+    result['lane'] = lane
+    result['category'] = category
+    result['importance_score'] = score
+    result['summary'] = result['executive_summary']
+    result['thesis_match_score'] = None  # Not used in new system
+
+    # Convert extracted_info to JSON string for storage
+    extracted_info = result['extracted_info']
+    result['extracted_info'] = dumps(extracted_info) if extracted_info else EMPTY_JSON
+
+    logger.info("[Briefly AI] Analysis complete -> Level: %s", result['importance_level'])
+
+    return result
+
+
+# Shared shape of every fallback result; _error_result fills in the message fields
+_ERROR_TEMPLATE = MappingProxyType({
+    'importance_level': ImportanceLevel.LOW_PRIORITY.value,
+    'lane': 'everything_else',
+    'category': 'LOW',
+    'importance_score': 2,
+    'action_required': 'No action required',
+    'deadlines': 'None',
+    'risks_leverage': 'None',
+    'sender_goals': 'Unknown',
+    'urgency_signals': 'None',
+    'reply_draft': '',
+    'thesis_match_score': None,
+})
+
+
+_NOISE_RESULT = MappingProxyType({
+    'importance_level': ImportanceLevel.LOW_PRIORITY.value,
+    'matches_user_profile': False,
+    'match_reasoning': 'Automated or bulk email',
+    'executive_summary': 'Automated newsletter or notification',
+    'action_required': 'No immediate action required',
+    'deadlines': 'No deadlines',
+    'risks_leverage': 'No significant risks or leverage points identified',
+    'sender_goals': 'General communication',
+    'urgency_signals': 'Standard priority',
+    'reply_draft': '',
+    'extracted_info': EMPTY_JSON,
+    'lane': 'everything_else',
+    'category': 'LOW',
+    'importance_score': 2,
+    'summary': 'Automated newsletter or notification',
+    'thesis_match_score': None,
+})
+
+
+def _error_result(summary: str, extracted_info: str = EMPTY_JSON, api_error: bool = False,
+                  executive_summary: str | None = None) -> dict:
+    """
+    Build a low-priority fallback result from the shared template.
+    extracted_info is the already-serialized JSON string for storage.
+    """
+    return {
+        **_ERROR_TEMPLATE,
+        'summary': summary,
+        'executive_summary': executive_summary or summary,
+        'extracted_info': extracted_info,
+        'api_error': api_error
+    }
+
+
+def _parse_error_result() -> dict:
+    """Fallback result when Gemini's reply could not be parsed."""
+    return _error_result('Unable to analyze email')
+
+
+# Fixed fallback text for the API failures users can act on:
+# (summary, executive_summary, serialized extracted_info)
+_API_ERROR_TEXT = MappingProxyType({
+    'quota': (
+        'AI analysis unavailable - API quota exceeded. Please upgrade your Gemini API plan.',
+        'AI analysis unavailable - API quota exceeded.',
+        dumps({'error': 'API quota exceeded'})
+    ),
+    'auth': (
+        'AI analysis unavailable - API authentication failed.',
+        None,
+        dumps({'error': 'API authentication failed'})
+    ),
+})
+
+
+def _api_error_result(error_msg: str) -> dict:
+    """Fallback result when the Gemini call itself failed."""
+    text = _API_ERROR_TEXT.get(error_kind(error_msg))
+    if text is None:
+        return _error_result(f'Analysis error: {error_msg[:50]}...', dumps({'error': error_msg}), api_error=True)
+    summary, executive_summary, extracted_info = text
+    return _error_result(summary, extracted_info, api_error=True, executive_summary=executive_summary)
+
+
+def _truncate(email_content: str, head: int = EMAIL_HEAD_CHARS, tail: int = EMAIL_TAIL_CHARS) -> str:
+    """Keep the start (subject, opening) and end (signature, call to action) of a long email."""
+    if len(email_content) <= head + tail + 64:
+        return email_content
+    return email_content[:head] + "\n\n[...truncated...]\n\n" + email_content[-tail:]
+
+
+def _chunk_request(email_contents: list[str], prompt_key: tuple) -> tuple[str, dict, bool]:
+    """
+    Build the Gemini request for a chunk of emails.
+    A single email uses the one-object prompt; several emails are sent
+    together and answered with a JSON array.
+
+    Returns:
+        (contents, config, batched) for models.generate_content
+    """
+    batched = len(email_contents) > 1
+    instructions, emails_header = _build_prompt_parts(*prompt_key, batched)
+    if batched:
+        prompt_body = "\n\n".join(
+            f"---EMAIL {index}---\n{_truncate(content)}" for index, content in enumerate(email_contents, start=1)
         )
+    else:
+        prompt_body = _truncate(email_contents[0])
+    email_prompt = f"{emails_header}\n{prompt_body}"
+
+    config = _BATCH_REPLY_CONFIG if batched else _REPLY_CONFIG
+    return f"{instructions}\n\n{email_prompt}", config, batched
+
+
+def _parse_chunk_response(response_text: str, count: int, batched: bool) -> list[dict]:
+    """Turn a Gemini reply into one normalized analysis per email in the chunk."""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[Briefly AI] Raw response: %.300s...", response_text)
+
+    if not batched:
+        # Single replies are validated while parsing
+        return [_normalize_result(decode_reply_as(response_text, BrieflyReply))]
+
+    parsed = decode_reply(response_text)
+
+    # Place each array item by its email_index, falling back to position
+    items = parsed if isinstance(parsed, list) else [parsed]
+    results: list[dict | None] = [None] * count
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        index = item.pop('email_index', position + 1)
+        index = index - 1 if isinstance(index, int) else position
+        if 0 <= index < len(results) and results[index] is None:
+            try:
+                results[index] = _normalize_result(item)
+            except msgspec.ValidationError as e:
+                logger.warning("[Briefly AI] Skipping malformed batch item %d: %s", index + 1, e)
+
+    missing = results.count(None)
+    if missing:
+        logger.warning("[Briefly AI] Batch response was missing %d of %d analyses", missing, len(results))
+    return [result if result is not None else _parse_error_result() for result in results]
+
+
+def _chunk_failure(error: Exception, count: int) -> list[dict]:
+    """Fallback results for every email in a chunk whose analysis failed."""
+    if isinstance(error, (orjson.JSONDecodeError, msgspec.DecodeError)):
+        logger.error("Briefly AI error: Failed to parse JSON response: %s", error)
+        result = _parse_error_result()
+    else:
+        error_msg = str(error)
+        logger.error("Briefly AI error: %s", error_msg)
+        result = _api_error_result(error_msg)
+    # Build the fallback once and hand each email its own copy
+    return [result] + [dict(result) for _ in range(count - 1)]
+
+
+def _analyze_chunk(client, email_contents: list[str], prompt_key: tuple, role_display: str) -> list[dict]:
+    """Analyze a chunk of emails with a single Gemini request."""
+    contents, config, batched = _chunk_request(email_contents, prompt_key)
+    logger.info("[Briefly AI] Analyzing %d email(s) for %s...", len(email_contents), role_display)
+    try:
+        return _parse_chunk_response(generate(client, contents, config), len(email_contents), batched)
+    except Exception as e:
+        return _chunk_failure(e, len(email_contents))
+
 
+async def _analyze_chunk_async(client, email_contents: list[str], prompt_key: tuple, role_display: str) -> list[dict]:
+    """Async counterpart of _analyze_chunk."""
+    contents, config, batched = _chunk_request(email_contents, prompt_key)
+    logger.info("[Briefly AI] Analyzing %d email(s) for %s...", len(email_contents), role_display)
     try:
-        response = call_gemini()
-
-        # Extract text from response
-        if hasattr(response, 'text') and response.text:
-            response_text = response.text.strip()
-        else:
-            response_text = str(response).strip()
-
-        logger.debug(f"[Briefly AI] Raw response: {response_text[:300]}...")
-
-        # Clean up response
-        if response_text.startswith('```json'):
-            response_text = response_text[7:]
-        if response_text.startswith('```'):
-            response_text = response_text[3:]
-        if response_text.endswith('```'):
-            response_text = response_text[:-3]
-        response_text = response_text.strip()
-
-        result = json.loads(response_text)
-
-        # Validate importance level
-        valid_levels = [level.value for level in ImportanceLevel]
-        if result.get('importance_level') not in valid_levels:
-            # Default to low priority if unclear
-            result['importance_level'] = ImportanceLevel.LOW_PRIORITY.value
-            logger.warning(f"[Briefly AI] Invalid importance level, defaulting to LOW_PRIORITY")
-
-        # Map importance level to score for sorting (higher = more important)
-        importance_score_mapping = {
-            ImportanceLevel.CRITICAL.value: 9,
-            ImportanceLevel.IMPORTANT.value: 7,
-            ImportanceLevel.USEFUL.value: 5,
-            ImportanceLevel.LOW_PRIORITY.value: 2
-        }
+        response_text = await generate_async(client, contents, config)
+        return _parse_chunk_response(response_text, len(email_contents), batched)
+    except Exception as e:
+        return _chunk_failure(e, len(email_contents))
 
-        score = importance_score_mapping.get(result['importance_level'], 2)
-
-        # Determine lane based on profile matching (NOT priority)
-        # - "priority_inbox" = emails that match user's profile/priorities
-        # - "everything_else" = emails that don't match user's profile
-        matches_profile = result.get('matches_user_profile', False)
-        
-        # Also support old lane values for backwards compatibility with existing database records
-        lane = 'priority_inbox' if matches_profile else 'everything_else'
-        
-        # Map to category for backwards compatibility
-        category_mapping = {
-            ImportanceLevel.CRITICAL.value: 'CRITICAL',
-            ImportanceLevel.IMPORTANT.value: 'HIGH',
-            ImportanceLevel.USEFUL.value: 'STANDARD',
-            ImportanceLevel.LOW_PRIORITY.value: 'LOW'
-        }
-        category = category_mapping.get(result['importance_level'], 'LOW')
-
-        # Ensure required fields exist
-        result.setdefault('executive_summary', 'Email analyzed')
-        result.setdefault('action_required', 'No immediate action required')
-        result.setdefault('deadlines', 'No deadlines')
-        result.setdefault('risks_leverage', 'No significant risks or leverage points identified')
-        result.setdefault('sender_goals', 'General communication')
-        result.setdefault('urgency_signals', 'Standard priority')
-        result.setdefault('reply_draft', '')
-        result.setdefault('match_reasoning', '')
-
-        # Add legacy compatibility fields
-        result['lane'] = lane
-        result['category'] = category
-        result['importance_score'] = score
-        result['summary'] = result['executive_summary']
-        result['thesis_match_score'] = None  # Not used in new system
-
-        # Convert extracted_info to JSON string for storage
-        result['extracted_info'] = json.dumps(result.get('extracted_info', {}))
-
-        logger.info(f"[Briefly AI] Analysis complete -> Level: {result['importance_level']}")
-
-        return result
-
-    except json.JSONDecodeError as e:
-        logger.error(f"Briefly AI error: Failed to parse JSON response: {e}")
-        return {
-            'importance_level': ImportanceLevel.LOW_PRIORITY.value,
-            'lane': 'everything_else',
-            'category': 'LOW',
-            'importance_score': 2,
-            'summary': 'Unable to analyze email',
-            'executive_summary': 'Unable to analyze email',
-            'action_required': 'No action required',
-            'deadlines': 'None',
-            'risks_leverage': 'None identified',
-            'sender_goals': 'Unknown',
-            'urgency_signals': 'None',
-            'reply_draft': '',
-            'thesis_match_score': None,
-            'extracted_info': json.dumps({})
+
+@lru_cache(maxsize=256)
+def _profile_keywords(current_focus: tuple[str, ...], critical_categories: tuple[str, ...]) -> tuple[str, ...]:
+    """Lower-cased focus areas and critical categories that keep an email out of the noise filter."""
+    return tuple(keyword.lower() for keyword in current_focus + critical_categories if keyword)
+
+
+def _is_noise(email_content: str, prompt_key: tuple) -> bool:
+    """Return True for bulk-platform mail that is neither transactional nor about the user's priorities."""
+    tail_start = max(len(email_content) - _NOISE_SCAN_CHARS, _NOISE_SCAN_CHARS)
+    if (_BULK_SENDER_RE.search(email_content, 0, _NOISE_SCAN_CHARS) is None
+            and _BULK_SENDER_RE.search(email_content, tail_start) is None):
+        return False
+    if _TRANSACTIONAL_RE.search(email_content) is not None:
+        return False
+    lowered = email_content.lower()
+    return not any(keyword in lowered for keyword in _profile_keywords(prompt_key[1], prompt_key[2]))
+
+
+def _local_result(email_content: str, key: tuple, prompt_key: tuple) -> dict | None:
+    """Answer an email without Gemini when possible: obvious bulk mail or a cached analysis."""
+    if _is_noise(email_content, prompt_key):
+        return dict(_NOISE_RESULT)
+    return _cached_response(key)
+
+
+def _response_cache_key(email_content: str, prompt_key: tuple) -> tuple:
+    """Key an analysis by the email's content hash and the persona fields that shape the prompt."""
+    return hashlib.sha256(email_content.encode('utf-8')).digest(), prompt_key
+
+
+def _cached_response(key: tuple) -> dict | None:
+    """Return a copy of a cached analysis, or None on a miss."""
+    with _response_cache_lock:
+        result = _response_cache.get(key)
+        if result is None:
+            return None
+        _response_cache.move_to_end(key)
+        return dict(result)
+
+
+def _store_response(key: tuple, result: dict):
+    """Cache a successful analysis, evicting the least recently used one when full."""
+    # Fallback results always carry api_error; don't let a failure stick
+    if 'api_error' in result:
+        return
+    with _response_cache_lock:
+        _response_cache[key] = dict(result)
+        _response_cache.move_to_end(key)
+        if len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+
+def clear_response_cache():
+    """Drop all cached analyses."""
+    with _response_cache_lock:
+        _response_cache.clear()
+
+
+def _profile_prompt_key(user_profile: dict, pdf_analysis_allowed: bool) -> tuple[tuple, str]:
+    """
+    Extract the persona fields that shape the prompt.
+
+    Returns:
+        (prompt_key, role_display) - prompt_key is the argument tuple for _build_prompt_parts
+    """
+    # Extract persona data with defaults
+    role = user_profile.get('role', 'Professional')
+    current_focus = user_profile.get('current_focus', [])
+    critical_categories = user_profile.get('critical_categories', [])
+    communication_style = user_profile.get('communication_style', 'Professional')
+    business_context = user_profile.get('business_context', '')
+
+    # Normalize role for display
+    # (a UserRole is also a str, but formats as its member name on newer Pythons)
+    role_display = role.value if isinstance(role, Enum) else role
+
+    prompt_key = (
+        role_display,
+        tuple(current_focus),
+        tuple(critical_categories),
+        communication_style,
+        business_context,
+        pdf_analysis_allowed
+    )
+    return prompt_key, role_display
+
+
+def _batch_chunks(email_contents: list[str], indexes: list[int], batch_size: int):
+    """
+    Group the given email indexes into Gemini requests of at most batch_size
+    emails and, beyond the first email, at most BATCH_CHAR_BUDGET characters.
+    """
+    chunk: list[int] = []
+    size = 0
+    for index in indexes:
+        # Length after _truncate, without building the truncated string
+        length = min(len(email_contents[index]), EMAIL_HEAD_CHARS + EMAIL_TAIL_CHARS + 64)
+        if chunk and (len(chunk) == batch_size or size + length > BATCH_CHAR_BUDGET):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(index)
+        size += length
+    if chunk:
+        yield chunk
+
+
+def analyze_emails_batch(
+    email_contents: list[str],
+    user_profile: dict,
+    pdf_analysis_allowed: bool = False,
+    batch_size: int = BATCH_SIZE
+) -> list[dict]:
+    """
+    Analyze several emails for the same user, sending up to batch_size emails
+    per Gemini request so the persona prompt and round-trip are shared.
+    Long emails are packed into smaller batches (see BATCH_CHAR_BUDGET).
+
+    Args:
+        email_contents: The email contents to analyze
+        user_profile: Dictionary containing user's persona data (see analyze_email_briefly_ai)
+        pdf_analysis_allowed: Whether advanced PDF analysis is enabled
+        batch_size: Maximum number of emails per Gemini request
+
+    Returns:
+        One analysis dict per email, in input order (same shape as analyze_email_briefly_ai)
+    """
+    prompt_key, role_display = _profile_prompt_key(user_profile, pdf_analysis_allowed)
+    keys = [_response_cache_key(content, prompt_key) for content in email_contents]
+    results = [_local_result(content, key, prompt_key) for content, key in zip(email_contents, keys)]
+
+    # Only emails that are neither noise nor cached go to Gemini, and
+    # identical emails in the batch are sent once and share the analysis
+    first_index: dict[tuple, int] = {}
+    pending = []
+    duplicates = []
+    for index, result in enumerate(results):
+        if result is None:
+            if first_index.setdefault(keys[index], index) == index:
+                pending.append(index)
+            else:
+                duplicates.append(index)
+    if pending:
+        client = gemini_ai.get_genai_client()
+    for chunk in _batch_chunks(email_contents, pending, batch_size):
+        analyses = _analyze_chunk(client, [email_contents[index] for index in chunk], prompt_key, role_display)
+        for index, result in zip(chunk, analyses):
+            _store_response(keys[index], result)
+            results[index] = result
+    for index in duplicates:
+        results[index] = dict(results[first_index[keys[index]]])
+    return results
+
+
+async def analyze_email_briefly_ai_async(
+    email_content: str,
+    user_profile: dict,
+    pdf_analysis_allowed: bool = False,
+    client=None
+) -> dict:
+    """
+    Async variant of analyze_email_briefly_ai for use inside an event loop.
+    Pass client to share one Gemini client across many calls.
+    """
+    prompt_key, role_display = _profile_prompt_key(user_profile, pdf_analysis_allowed)
+    key = _response_cache_key(email_content, prompt_key)
+    result = _local_result(email_content, key, prompt_key)
+    if result is None:
+        client = client or gemini_ai.get_genai_client()
+        result = (await _analyze_chunk_async(client, [email_content], prompt_key, role_display))[0]
+        _store_response(key, result)
+    return result
+
+
+async def analyze_batch(
+    email_contents: list[str],
+    user_profile: dict,
+    pdf_analysis_allowed: bool = False,
+    concurrency: int = 8
+) -> list[dict]:
+    """
+    Analyze emails concurrently, one Gemini request per email with at most
+    concurrency requests in flight. A failure only affects its own email.
+    Sync callers can use asyncio.run(analyze_batch(...)).
+
+    Returns:
+        One analysis dict per email, in input order (same shape as analyze_email_briefly_ai)
+    """
+    client = gemini_ai.get_genai_client()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def analyze_one(email_content: str) -> dict:
+        async with semaphore:
+            return await analyze_email_briefly_ai_async(email_content, user_profile, pdf_analysis_allowed, client)
+
+    outcomes = await asyncio.gather(*(analyze_one(content) for content in email_contents), return_exceptions=True)
+    return [
+        _api_error_result(str(outcome)) if isinstance(outcome, BaseException) else outcome
+        for outcome in outcomes
+    ]
+
+
+def analyze_email_briefly_ai(
+    email_content: str,
+    user_profile: dict,
+    pdf_analysis_allowed: bool = False
+) -> dict:
+    """
+    Briefly AI Email Analysis Engine.
+    Implements intelligent prioritization, summarization, and reply-drafting based on user context.
+
+    Args:
+        email_content: The email content to analyze
+        user_profile: Dictionary containing user's persona data:
+            - role: User's professional role
+            - current_focus: List of current priorities
+            - critical_categories: List of categories that are critical
+            - communication_style: Preferred communication style
+            - business_context: Business goals and context
+        pdf_analysis_allowed: Whether advanced PDF analysis is enabled
+
+    Returns:
+        {
+            'importance_level': ImportanceLevel enum value,
+            'summary': str (1-3 sentence executive summary),
+            'action_required': str,
+            'deadlines': str,
+            'risks_leverage': str,
+            'sender_goals': str,
+            'urgency_signals': str,
+            'reply_draft': str (if appropriate),
+            'extracted_info': dict
         }
-    except Exception as e:
-        error_msg = str(e)
-        logger.error(f"Briefly AI error: {error_msg}")
-
-        # Check for specific API errors
-        if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg or "quota" in error_msg.lower():
-            return {
-                'importance_level': ImportanceLevel.LOW_PRIORITY.value,
-                'lane': 'everything_else',
-                'category': 'LOW',
-                'importance_score': 2,
-                'summary': 'AI analysis unavailable - API quota exceeded. Please upgrade your Gemini API plan.',
-                'executive_summary': 'AI analysis unavailable - API quota exceeded.',
-                'action_required': 'No action required',
-                'deadlines': 'None',
-                'risks_leverage': 'None',
-                'sender_goals': 'Unknown',
-                'urgency_signals': 'None',
-                'reply_draft': '',
-                'thesis_match_score': None,
-                'extracted_info': json.dumps({'error': 'API quota exceeded'}),
-                'api_error': True
-            }
-        elif "403" in error_msg or "PERMISSION_DENIED" in error_msg:
-            return {
-                'importance_level': ImportanceLevel.LOW_PRIORITY.value,
-                'lane': 'everything_else',
-                'category': 'LOW',
-                'importance_score': 2,
-                'summary': 'AI analysis unavailable - API authentication failed.',
-                'executive_summary': 'AI analysis unavailable - API authentication failed.',
-                'action_required': 'No action required',
-                'deadlines': 'None',
-                'risks_leverage': 'None',
-                'sender_goals': 'Unknown',
-                'urgency_signals': 'None',
-                'reply_draft': '',
-                'thesis_match_score': None,
-                'extracted_info': json.dumps({'error': 'API authentication failed'}),
-                'api_error': True
-            }
-        else:
-            return {
-                'importance_level': ImportanceLevel.LOW_PRIORITY.value,
-                'lane': 'everything_else',
-                'category': 'LOW',
-                'importance_score': 2,
-                'summary': f'Analysis error: {error_msg[:50]}...',
-                'executive_summary': f'Analysis error: {error_msg[:50]}...',
-                'action_required': 'No action required',
-                'deadlines': 'None',
-                'risks_leverage': 'None',
-                'sender_goals': 'Unknown',
-                'urgency_signals': 'None',
-                'reply_draft': '',
-                'thesis_match_score': None,
-                'extracted_info': json.dumps({'error': error_msg}),
-                'api_error': True
-            }
+    """
+    return analyze_emails_batch([email_content], user_profile, pdf_analysis_allowed, batch_size=1)[0]
 
 
 # Backward compatibility function
-def classify_email_dual_pipeline(email_content: str, user_profile: Dict, pdf_analysis_allowed: bool = False) -> Dict:
+def classify_email_dual_pipeline(
+    email_content: str,
+    user_profile: dict | None = None,
+    pdf_analysis_allowed: bool = False,
+    keywords: list[str] | None = None,
+    user_role: str | None = None
+) -> dict:
     """
     Backward compatibility wrapper for the new Briefly AI analysis engine.
+    Also accepts the old (keywords, user_role) signature, which is turned
+    into a persona profile with the keywords as the current focus.
     """
+    if user_profile is None:
+        user_profile = {
+            'role': user_role or 'Professional',
+            'current_focus': keywords or []
+        }
     return analyze_email_briefly_ai(email_content, user_profile, pdf_analysis_allowed)
+
+
+async def classify_emails_batch(
+    email_contents: list[str],
+    user_profile: dict,
+    pdf_analysis_allowed: bool = False,
+    concurrency: int = 10
+) -> list[dict]:
+    """
+    Async batch counterpart of classify_email_dual_pipeline.
+    Classifies the emails concurrently on the client's aio surface, with at
+    most concurrency Gemini requests in flight (see analyze_batch).
+    """
+    return await analyze_batch(email_contents, user_profile, pdf_analysis_allowed, concurrency)
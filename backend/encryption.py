@@ -3,33 +3,74 @@ Encryption utility module for database security.
 Handles encryption and decryption of sensitive user data.
 """
 import os
+import base64
+import logging
+from functools import lru_cache
+from typing import List, Optional
 from cryptography.fernet import Fernet
-from dotenv import load_dotenv
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 # Get encryption key from environment
 ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY', '')
 
-# Initialize Fernet cipher
-_cipher = None
+# Encrypted values are urlsafe base64 of: version byte + nonce + ciphertext and tag.
+# Fernet tokens start with version byte 0x80, so the two formats can't be confused.
+AESGCM_VERSION = b'\x01'
+FERNET_VERSION = 0x80
+NONCE_SIZE = 12
 
 
+@lru_cache(maxsize=1)
 def get_cipher():
-    """Get or create Fernet cipher instance."""
-    global _cipher
-    if _cipher is None:
-        if not ENCRYPTION_KEY:
-            raise ValueError(
-                "ENCRYPTION_KEY not found in environment variables. "
-                "Please set ENCRYPTION_KEY in your .env file. "
-                "Generate a key using: python -c 'from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())'"
-            )
-        try:
-            _cipher = Fernet(ENCRYPTION_KEY.encode())
-        except Exception as e:
-            raise ValueError(f"Invalid ENCRYPTION_KEY format: {e}")
-    return _cipher
+    """Get or create Fernet cipher instance (decrypts values written before the AES-GCM switch)."""
+    if not ENCRYPTION_KEY:
+        raise ValueError(
+            "ENCRYPTION_KEY not found in environment variables. "
+            "Please set ENCRYPTION_KEY in your .env file. "
+            "Generate a key using: python -c 'from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())'"
+        )
+    try:
+        return Fernet(ENCRYPTION_KEY.encode())
+    except Exception as e:
+        raise ValueError(f"Invalid ENCRYPTION_KEY format: {e}")
+
+
+@lru_cache(maxsize=1)
+def get_aead():
+    """Get or create the AES-GCM cipher instance, keyed from ENCRYPTION_KEY."""
+    # get_cipher() validates ENCRYPTION_KEY first
+    get_cipher()
+    # Derive a separate AES-256 key so the Fernet key material isn't reused as-is
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'briefly aes-gcm v1')
+    return AESGCM(hkdf.derive(base64.urlsafe_b64decode(ENCRYPTION_KEY)))
+
+
+def reset_cipher():
+    """Drop the cached ciphers so the next call rebuilds them from ENCRYPTION_KEY."""
+    get_cipher.cache_clear()
+    get_aead.cache_clear()
+
+
+def _encrypt(aead, text: str) -> str:
+    """Encrypt one non-empty string into the versioned AES-GCM format."""
+    nonce = os.urandom(NONCE_SIZE)
+    token = AESGCM_VERSION + nonce + aead.encrypt(nonce, text.encode('utf-8'), None)
+    return base64.urlsafe_b64encode(token).decode('ascii')
+
+
+def _decrypt(aead, encrypted_text: str) -> str:
+    """Decrypt one AES-GCM or legacy Fernet value; raises if it is neither."""
+    token = base64.urlsafe_b64decode(encrypted_text)
+    if token[0] == FERNET_VERSION:
+        return get_cipher().decrypt(encrypted_text.encode('utf-8')).decode('utf-8')
+    if token[:1] != AESGCM_VERSION:
+        raise ValueError("Unknown encryption format")
+    nonce = token[1:1 + NONCE_SIZE]
+    return aead.decrypt(nonce, token[1 + NONCE_SIZE:], None).decode('utf-8')
 
 
 def encrypt_text(text: str) -> str:
@@ -46,12 +87,10 @@ def encrypt_text(text: str) -> str:
         return text
     
     try:
-        cipher = get_cipher()
-        encrypted_bytes = cipher.encrypt(text.encode('utf-8'))
-        return encrypted_bytes.decode('utf-8')
+        return _encrypt(get_aead(), text)
     except Exception as e:
         # Log error but don't expose sensitive data
-        print(f"Encryption error: Failed to encrypt data (error type: {type(e).__name__})")
+        logger.error("Encryption error: Failed to encrypt data (error type: %s)", type(e).__name__)
         raise
 
 
@@ -69,12 +108,53 @@ def decrypt_text(encrypted_text: str) -> str:
         return encrypted_text
     
     try:
-        cipher = get_cipher()
-        decrypted_bytes = cipher.decrypt(encrypted_text.encode('utf-8'))
-        return decrypted_bytes.decode('utf-8')
+        return _decrypt(get_aead(), encrypted_text)
     except Exception as e:
         # If decryption fails, might be unencrypted legacy data
         # Return as-is (for backward compatibility during migration)
-        print(f"Decryption error: Data may be unencrypted legacy data (error type: {type(e).__name__})")
+        logger.warning("Decryption error: Data may be unencrypted legacy data (error type: %s)", type(e).__name__)
         return encrypted_text
 
+
+def encrypt_many(texts: List[Optional[str]]) -> List[Optional[str]]:
+    """
+    Encrypt a batch of text strings with a single cipher lookup.
+    
+    Args:
+        texts: Plain texts to encrypt (empty/None values pass through)
+        
+    Returns:
+        Encrypted texts as base64 strings, in the same order
+    """
+    aead = get_aead()
+    try:
+        return [_encrypt(aead, text) if text else text for text in texts]
+    except Exception as e:
+        # Log error but don't expose sensitive data
+        logger.error("Encryption error: Failed to encrypt data (error type: %s)", type(e).__name__)
+        raise
+
+
+def decrypt_many(encrypted_texts: List[Optional[str]]) -> List[Optional[str]]:
+    """
+    Decrypt a batch of text strings with a single cipher lookup.
+    
+    Args:
+        encrypted_texts: Encrypted texts as base64 strings (empty/None values pass through)
+        
+    Returns:
+        Decrypted plain texts, in the same order
+    """
+    aead = get_aead()
+    decrypted = []
+    for encrypted_text in encrypted_texts:
+        if not encrypted_text:
+            decrypted.append(encrypted_text)
+            continue
+        try:
+            decrypted.append(_decrypt(aead, encrypted_text))
+        except Exception as e:
+            # Might be unencrypted legacy data - return as-is, like decrypt_text
+            logger.warning("Decryption error: Data may be unencrypted legacy data (error type: %s)", type(e).__name__)
+            decrypted.append(encrypted_text)
+    return decrypted
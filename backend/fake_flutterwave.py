@@ -5,16 +5,20 @@ This script simulates a successful Flutterwave charge.completed webhook event
 to test the subscription activation flow.
 
 Usage:
-    python fake_flutterwave.py
+    python fake_flutterwave.py          # send one webhook
+    python fake_flutterwave.py 50       # load test: send 50 webhooks concurrently
+
+Set BRIEFLY_VERBOSE=1 to also print the payload being sent.
 
 Make sure the backend server is running at http://127.0.0.1:8000
 """
 
 import os
 import sys
-import json
+import orjson
+import asyncio
 import hashlib
-import requests
+import httpx
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -34,10 +38,21 @@ PLAN_TO_ACTIVATE = "pro"  # Options: "standard" ($29) or "pro" ($49)
 
 # Get the secret hash from environment
 FLUTTERWAVE_SECRET_HASH = os.getenv("FLUTTERWAVE_SECRET_HASH", "briefly_secure_hash_2026")
+_SECRET_BYTES = FLUTTERWAVE_SECRET_HASH.encode()
+
+# Print the full payload before sending (off by default)
+VERBOSE = bool(os.getenv("BRIEFLY_VERBOSE"))
 
 # Backend webhook URL
 WEBHOOK_URL = "http://127.0.0.1:8000/api/webhooks/flutterwave"
 
+# Parsed once and reused by every send
+_WEBHOOK_URL = httpx.URL(WEBHOOK_URL)
+
+# Shared keep-alive client for single sends, so repeated sends reuse one
+# connection; blast() load tests with its own AsyncClient.
+_client = httpx.Client(timeout=30, limits=httpx.Limits(max_connections=4, max_keepalive_connections=4))
+
 def generate_fake_webhook_payload():
     """
     Generate a fake Flutterwave charge.completed webhook payload.
@@ -47,10 +62,15 @@ def generate_fake_webhook_payload():
     # Set amount based on plan
     amount = 49.00 if PLAN_TO_ACTIVATE == "pro" else 29.00
     
+    # Read the clock once; every timestamp in the payload uses it
+    now = datetime.now()
+    timestamp = now.strftime('%Y%m%d%H%M%S')
+    created_at = now.isoformat()
+    
     # Generate fake IDs
-    tx_ref = f"{USER_ID_TO_UPGRADE}|{PLAN_TO_ACTIVATE}|{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    tx_ref = f"{USER_ID_TO_UPGRADE}|{PLAN_TO_ACTIVATE}|{timestamp}"
     payment_id = 1234567890
-    flw_ref = f"FLW-MOCK-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    flw_ref = f"FLW-MOCK-{timestamp}"
     
     payload = {
         "event": "charge.completed",
@@ -70,14 +90,14 @@ def generate_fake_webhook_payload():
             "narration": f"Briefly AI - {PLAN_TO_ACTIVATE.title()} Plan Subscription",
             "status": "successful",
             "payment_type": "card",
-            "created_at": datetime.now().isoformat(),
+            "created_at": created_at,
             "account_id": 12345,
             "customer": {
                 "id": 987654,
                 "name": "Test User",
                 "phone_number": "+1234567890",
                 "email": "testuser@example.com",
-                "created_at": datetime.now().isoformat()
+                "created_at": created_at
             },
             "card": {
                 "first_6digits": "553188",
@@ -99,6 +119,21 @@ def generate_fake_webhook_payload():
     return payload
 
 
+def build_headers(payload_bytes: bytes) -> dict:
+    """
+    Build the request headers, including the verification hash (body + secret).
+    Note: Flutterwave uses SHA-512 hash of body + secret
+    """
+    # Fed in two parts, so the payload isn't copied into a concatenated buffer
+    digest = hashlib.sha512(payload_bytes)
+    digest.update(_SECRET_BYTES)
+    expected_hash = digest.hexdigest()
+    return {
+        "Content-Type": "application/json",
+        "verif-hash": expected_hash
+    }
+
+
 def send_webhook():
     """
     Send the fake webhook to the local backend server.
@@ -115,23 +150,16 @@ def send_webhook():
     
     # Generate the payload
     payload = generate_fake_webhook_payload()
-    payload_json = json.dumps(payload)
+    # Serialized once; these exact bytes are printed, hashed and sent
+    payload_bytes = orjson.dumps(payload)
     
-    print("[>] Payload being sent:")
-    print(json.dumps(payload, indent=2))
-    print()
-    
-    # Calculate the verification hash (body + secret)
-    # Note: Flutterwave uses SHA-512 hash of body + secret
-    expected_hash = hashlib.sha512(
-        (payload_json + FLUTTERWAVE_SECRET_HASH).encode()
-    ).hexdigest()
+    if VERBOSE:
+        print("[>] Payload being sent:")
+        print(payload_bytes.decode())
+        print()
     
-    # Set headers
-    headers = {
-        "Content-Type": "application/json",
-        "verif-hash": expected_hash
-    }
+    headers = build_headers(payload_bytes)
+    expected_hash = headers["verif-hash"]
     
     print(f"[>] Verification hash: {expected_hash[:32]}...")
     print()
@@ -139,11 +167,10 @@ def send_webhook():
     try:
         # Send the request
         print("[*] Sending webhook request...")
-        response = requests.post(
-            WEBHOOK_URL,
-            data=payload_json,
-            headers=headers,
-            timeout=30
+        response = _client.post(
+            _WEBHOOK_URL,
+            content=payload_bytes,
+            headers=headers
         )
         
         print()
@@ -156,7 +183,7 @@ def send_webhook():
         print("Response Body:")
         try:
             response_json = response.json()
-            print(json.dumps(response_json, indent=2))
+            print(orjson.dumps(response_json, option=orjson.OPT_INDENT_2).decode())
         except:
             print(response.text)
         
@@ -167,7 +194,7 @@ def send_webhook():
         else:
             print("[!] Webhook processing failed. Check the error above.")
             
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         print("[X] ERROR: Could not connect to the backend server.")
         print("    Make sure the server is running at http://127.0.0.1:8000")
         print()
@@ -177,5 +204,34 @@ def send_webhook():
         print(f"[X] ERROR: {e}")
 
 
+async def blast(count: int) -> list:
+    """
+    Send the fake webhook count times concurrently over one async client.
+    Returns the status codes (or exceptions) in send order.
+    """
+    payload_bytes = orjson.dumps(generate_fake_webhook_payload())
+    headers = build_headers(payload_bytes)
+    async with httpx.AsyncClient(timeout=30) as client:
+        return await asyncio.gather(
+            *(client.post(_WEBHOOK_URL, content=payload_bytes, headers=headers) for _ in range(count)),
+            return_exceptions=True
+        )
+
+
+def run_blast(count: int):
+    """Load-test the webhook endpoint and print a status code summary."""
+    print(f"[*] Sending {count} webhooks to {WEBHOOK_URL}...")
+    results = asyncio.run(blast(count))
+    summary = {}
+    for result in results:
+        key = type(result).__name__ if isinstance(result, Exception) else result.status_code
+        summary[key] = summary.get(key, 0) + 1
+    for key, total in summary.items():
+        print(f"    {key}: {total}")
+
+
 if __name__ == "__main__":
-    send_webhook()
+    if len(sys.argv) > 1:
+        run_blast(int(sys.argv[1]))
+    else:
+        send_webhook()
@@ -3,22 +3,235 @@ Gemini AI integration module.
 Handles email analysis using Google Gemini 2.0 Flash.
 """
 import os
-import json
-from typing import Dict, Optional
+import asyncio
+import logging
+import msgspec
+from functools import lru_cache
+from typing import Dict, List, Optional
 from google import genai
-from dotenv import load_dotenv
+from classifier_core import EMPTY_JSON, decode_reply_as, generate, generate_async
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
+# Categories the analyze_email prompt asks for
+_VALID_CATEGORIES = frozenset(('CRITICAL', 'HIGH', 'STANDARD', 'LOW'))
 
+# JSON-mode request config; the schema mirrors the output structure in the prompt
+_STRING_SCHEMA = {'type': 'STRING'}
+_STRING_LIST_SCHEMA = {'type': 'ARRAY', 'items': _STRING_SCHEMA}
+_ANALYSIS_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'importance_score': {'type': 'INTEGER'},
+        'category': {'type': 'STRING', 'enum': ['CRITICAL', 'HIGH', 'STANDARD', 'LOW']},
+        'summary': _STRING_SCHEMA,
+        'extracted_info': {
+            'type': 'OBJECT',
+            'properties': {
+                'money': _STRING_SCHEMA,
+                'links': _STRING_LIST_SCHEMA,
+                'sender_info': _STRING_SCHEMA,
+                'deal_details': _STRING_SCHEMA,
+                'action_items': _STRING_LIST_SCHEMA
+            }
+        }
+    },
+    'required': ['importance_score', 'category', 'summary', 'extracted_info']
+}
+_ANALYSIS_CONFIG = {'response_mime_type': 'application/json', 'response_schema': _ANALYSIS_SCHEMA}
+_BATCH_ANALYSIS_SCHEMA = {
+    'type': 'ARRAY',
+    'items': {
+        'type': 'OBJECT',
+        'properties': {'email_index': {'type': 'INTEGER'}, **_ANALYSIS_SCHEMA['properties']},
+        'required': ['email_index', *_ANALYSIS_SCHEMA['required']]
+    }
+}
+_BATCH_ANALYSIS_CONFIG = {'response_mime_type': 'application/json', 'response_schema': _BATCH_ANALYSIS_SCHEMA}
+
+# Emails sent to Gemini per request by analyze_emails_batch
+BATCH_SIZE = 10
+
+
+def _category_for_score(score: int) -> str:
+    """Category for an importance score, per the prompt's Category Mapping."""
+    if score >= 9:
+        return 'CRITICAL'
+    if score >= 7:
+        return 'HIGH'
+    if score >= 5:
+        return 'STANDARD'
+    return 'LOW'
+
+
+class AnalysisReply(msgspec.Struct):
+    """Gemini's reply to the analyze_email prompt, with defaults for omitted fields."""
+    importance_score: Optional[int] = 0
+    category: Optional[str] = None
+    summary: Optional[str] = 'Email analyzed'
+    # Kept as the raw JSON text of the reply, which is already the stored shape
+    extracted_info: msgspec.Raw = msgspec.Raw(EMPTY_JSON.encode())
+
+
+class BatchAnalysisReply(AnalysisReply):
+    """One item of Gemini's reply to a batched prompt."""
+    email_index: Optional[int] = None
+
+
+# Output format section of the prompt, shared by the single and batched variants
+_OUTPUT_FIELDS = """    "importance_score": 0-10,
+    "category": "CRITICAL" | "HIGH" | "STANDARD" | "LOW",
+    "summary": "One sentence summary of the email",
+    "extracted_info": {
+        "money": "Any monetary amounts mentioned",
+        "links": ["List of important links"],
+        "sender_info": "Key information about the sender",
+        "deal_details": "Details about any deals or opportunities",
+        "action_items": ["List of required actions or deadlines"]
+    }"""
+
+_SINGLE_OUTPUT = f"""
+
+Output your response as a JSON object with this exact structure:
+{{
+{_OUTPUT_FIELDS}
+}}
+
+Only return the JSON object, no additional text."""
+
+_BATCH_OUTPUT = f"""
+
+Output your response as a JSON array with one object per email, each with this exact structure:
+{{
+    "email_index": "The n from the email's ---EMAIL n--- line",
+{_OUTPUT_FIELDS}
+}}
+
+Only return the JSON array, no additional text."""
+
+
+def _profile_fields(user_profile: Dict) -> tuple:
+    """
+    Extract the persona fields the prompt uses, with defaults, as the hashable
+    argument tuple for _prompt_parts: (role, current_focus, critical_categories, business_context).
+    """
+    return (
+        user_profile.get('role', 'Professional'),
+        tuple(user_profile.get('current_focus', [])),
+        tuple(user_profile.get('critical_categories', [])),
+        user_profile.get('business_context', '')
+    )
+
+
+@lru_cache(maxsize=64)
+def _prompt_parts(role, current_focus, critical_categories, business_context, batched: bool) -> tuple:
+    """
+    Build the persona prompt around the email section, once per profile.
+
+    Returns:
+        (head, tail) - the prompt is head + email(s) + tail
+    """
+    head = f"""You are an Executive Assistant for a {role}.
+Their current top priorities are: {', '.join(current_focus) if current_focus else 'General business development'}.
+They absolutely cannot miss emails about: {', '.join(critical_categories) if critical_categories else 'Critical business matters'}.
+
+Business Context: {business_context if business_context else 'No additional context provided'}
+
+**Your Goal:**
+Rank every email from 0-10 based on how well it aligns with their priorities.
+
+**Ranking Logic:**
+- **Score 9-10 (Critical):** Direct matches to 'Critical Categories' or urgent 'Current Focus' items. Immediate action required.
+- **Score 7-8 (Important):** Relevant to their Role or secondary focus areas. Should review soon.
+- **Score 5-6 (Standard):** Generally relevant but not urgent. Normal priority.
+- **Score 3-4 (Low):** Somewhat related but not immediately relevant.
+- **Score 0-2 (Noise):** Generic newsletters, cold sales, or irrelevant updates.
+
+**Category Mapping:**
+- 9-10: CRITICAL
+- 7-8: HIGH
+- 5-6: STANDARD
+- 0-4: LOW
+
+**Analysis Requirements:**
+For all emails (regardless of score), extract:
+- Money amounts mentioned
+- Important links (especially Gmail links, deal documents, contracts)
+- Key sender information
+- Deal/opportunity details
+- Action items or deadlines
+
+"""
+    if batched:
+        return head + "Emails (each one starts with a ---EMAIL n--- line):\n", _BATCH_OUTPUT
+    return head + "Email Content:\n", _SINGLE_OUTPUT
+
+
+def _raw_object(raw: msgspec.Raw) -> str:
+    """Return a raw JSON value as a string if it is an object, else the empty object."""
+    text = bytes(raw).decode('utf-8')
+    return text if text.startswith('{') else EMPTY_JSON
+
+
+def _analysis_result(reply: AnalysisReply) -> Dict:
+    """Turn a decoded reply into the stored analysis shape."""
+    score = min(max(reply.importance_score or 0, 0), 10)
+
+    # Ensure category is valid, falling back to the score's category
+    category = reply.category
+    if category not in _VALID_CATEGORIES:
+        category = _category_for_score(score)
+
+    return {
+        'importance_score': score,
+        'category': category,
+        'summary': reply.summary or 'Email analyzed',
+        # Store extracted_info as Gemini wrote it instead of parsing and re-serializing it
+        'extracted_info': _raw_object(reply.extracted_info)
+    }
+
+
+def _fallback_result(summary: str) -> Dict:
+    """Low-priority result for an email that could not be analyzed."""
+    return {
+        'category': 'LOW_PRIORITY',
+        'summary': summary,
+        'extracted_info': EMPTY_JSON
+    }
+
+
+def _failure_result(error: Exception) -> Dict:
+    """Log a failed analysis and return the matching fallback result."""
+    if isinstance(error, msgspec.DecodeError):
+        logger.error("Gemini API error: Failed to parse JSON response (error: %s)", error)
+        return _fallback_result('Unable to analyze email')
+    if isinstance(error, ValueError):
+        # Handle API key errors or configuration issues
+        logger.error("Gemini API error: Configuration issue (check GEMINI_API_KEY in .env): %s", error)
+        return _fallback_result('Error during analysis (API configuration issue)')
+    logger.error("Gemini API error: Failed to analyze email (error type: %s, message: %s)", type(error).__name__, error)
+    return _fallback_result('Error during analysis')
+
+
+@lru_cache(maxsize=1)
 def get_genai_client():
-    """Initialize and return Gemini API client."""
+    """Return the shared Gemini API client, creating it on first use."""
     api_key = os.getenv('GEMINI_API_KEY')
     if not api_key:
         raise ValueError("GEMINI_API_KEY not found in environment variables")
     return genai.Client(api_key=api_key)
 
 
+def _single_result(response_text: str) -> Dict:
+    """Turn the text of a single-email reply into the stored analysis shape."""
+    if not response_text:
+        logger.error("Gemini API error: Empty response from API")
+        return _fallback_result('Unable to analyze email (empty response)')
+
+    # Parsed and type-checked in one pass
+    return _analysis_result(decode_reply_as(response_text, AnalysisReply))
+
+
 def analyze_email(email_content: str, user_profile: Dict) -> Dict:
     """
     Analyze an email against user's persona-based profile using Gemini AI.
@@ -41,147 +254,101 @@ def analyze_email(email_content: str, user_profile: Dict) -> Dict:
         }
     """
     client = get_genai_client()
+    head, tail = _prompt_parts(*_profile_fields(user_profile), batched=False)
 
-    # Extract persona data with defaults
-    role = user_profile.get('role', 'Professional')
-    current_focus = user_profile.get('current_focus', [])
-    critical_categories = user_profile.get('critical_categories', [])
-    communication_style = user_profile.get('communication_style', 'Professional')
-    business_context = user_profile.get('business_context', '')
+    try:
+        return _single_result(generate(client, head + email_content + tail, _ANALYSIS_CONFIG))
+    except Exception as e:
+        return _failure_result(e)
 
-    # Build system prompt based on persona
-    system_prompt = f"""You are an Executive Assistant for a {role}.
-Their current top priorities are: {', '.join(current_focus) if current_focus else 'General business development'}.
-They absolutely cannot miss emails about: {', '.join(critical_categories) if critical_categories else 'Critical business matters'}.
 
-Business Context: {business_context if business_context else 'No additional context provided'}
+async def analyze_email_async(email_content: str, user_profile: Dict, client=None) -> Dict:
+    """
+    Async variant of analyze_email for use inside an event loop.
+    Pass client to share one Gemini client across many calls.
+    """
+    client = client or get_genai_client()
+    head, tail = _prompt_parts(*_profile_fields(user_profile), batched=False)
 
-**Your Goal:**
-Rank every email from 0-10 based on how well it aligns with their priorities.
+    try:
+        return _single_result(await generate_async(client, head + email_content + tail, _ANALYSIS_CONFIG))
+    except Exception as e:
+        return _failure_result(e)
 
-**Ranking Logic:**
-- **Score 9-10 (Critical):** Direct matches to 'Critical Categories' or urgent 'Current Focus' items. Immediate action required.
-- **Score 7-8 (Important):** Relevant to their Role or secondary focus areas. Should review soon.
-- **Score 5-6 (Standard):** Generally relevant but not urgent. Normal priority.
-- **Score 3-4 (Low):** Somewhat related but not immediately relevant.
-- **Score 0-2 (Noise):** Generic newsletters, cold sales, or irrelevant updates.
 
-**Category Mapping:**
-- 9-10: CRITICAL
-- 7-8: HIGH
-- 5-6: STANDARD
-- 0-4: LOW
+async def analyze_emails_async(email_contents: List[str], user_profile: Dict, concurrency: int = 8) -> List[Dict]:
+    """
+    Analyze emails concurrently, one Gemini request per email with at most
+    concurrency requests in flight. Sync callers can use asyncio.run(analyze_emails_async(...)).
 
-**Analysis Requirements:**
-For all emails (regardless of score), extract:
-- Money amounts mentioned
-- Important links (especially Gmail links, deal documents, contracts)
-- Key sender information
-- Deal/opportunity details
-- Action items or deadlines
+    Returns:
+        One analysis dict per email, in input order (same shape as analyze_email)
+    """
+    client = get_genai_client()
+    semaphore = asyncio.Semaphore(concurrency)
 
-Email Content:
-{email_content}
+    async def analyze_one(email_content: str) -> Dict:
+        async with semaphore:
+            return await analyze_email_async(email_content, user_profile, client)
 
-Output your response as a JSON object with this exact structure:
-{{
-    "importance_score": 0-10,
-    "category": "CRITICAL" | "HIGH" | "STANDARD" | "LOW",
-    "summary": "One sentence summary of the email",
-    "extracted_info": {{
-        "money": "Any monetary amounts mentioned",
-        "links": ["List of important links"],
-        "sender_info": "Key information about the sender",
-        "deal_details": "Details about any deals or opportunities",
-        "action_items": ["List of required actions or deadlines"]
-    }}
-}}
+    return list(await asyncio.gather(*(analyze_one(content) for content in email_contents)))
 
-Only return the JSON object, no additional text."""
 
+def _analyze_chunk(client, head: str, tail: str, email_contents: List[str]) -> List[Dict]:
+    """Analyze several emails with one Gemini request answered by a JSON array."""
+    emails = "\n\n".join(f"---EMAIL {index}---\n{content}" for index, content in enumerate(email_contents, start=1))
     try:
-        # Use gemini-2.5-flash (free tier available) - best performance for email analysis
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt
-        )
-        
-        # Extract text from response - new google.genai API returns response with .text attribute
-        if hasattr(response, 'text') and response.text:
-            response_text = response.text.strip()
-        else:
-            # Fallback: try to extract from response object structure
-            print(f"Gemini API error: Unexpected response format - response type: {type(response)}")
-            # Try to get string representation
-            response_text = str(response).strip()
-            if not response_text or len(response_text) < 10:
-                print(f"Gemini API error: Could not extract text from response")
-                return {
-                    'category': 'LOW_PRIORITY',
-                    'summary': 'Unable to analyze email (unexpected response format)',
-                    'extracted_info': json.dumps({})
-                }
-        
-        if not response_text:
-            print(f"Gemini API error: Empty response from API")
-            return {
-                'category': 'LOW_PRIORITY',
-                'summary': 'Unable to analyze email (empty response)',
-                'extracted_info': json.dumps({})
-            }
-        
-        # Clean up response (remove markdown code blocks if present)
-        if response_text.startswith('```json'):
-            response_text = response_text[7:]
-        if response_text.startswith('```'):
-            response_text = response_text[3:]
-        if response_text.endswith('```'):
-            response_text = response_text[:-3]
-        response_text = response_text.strip()
-        
-        # Validate response is not empty after cleanup
+        response_text = generate(client, head + emails + tail, _BATCH_ANALYSIS_CONFIG)
+
         if not response_text:
-            print(f"Gemini API error: Empty response after cleanup")
-            return {
-                'category': 'LOW_PRIORITY',
-                'summary': 'Unable to analyze email (empty response)',
-                'extracted_info': json.dumps({})
-            }
-        
-        result = json.loads(response_text)
-        
-        # Ensure category is valid
-        if result.get('category') not in ['CRITICAL', 'MATCH', 'LOW_PRIORITY']:
-            result['category'] = 'LOW_PRIORITY'
-        
-        # Ensure summary exists
-        if 'summary' not in result:
-            result['summary'] = 'Email analyzed'
-        
-        # Convert extracted_info to JSON string for storage
-        result['extracted_info'] = json.dumps(result.get('extracted_info', {}))
-        
-        return result
-    except json.JSONDecodeError as e:
-        print(f"Gemini API error: Failed to parse JSON response (error: {e})")
-        # Return default response
-        return {
-            'category': 'LOW_PRIORITY',
-            'summary': 'Unable to analyze email',
-            'extracted_info': json.dumps({})
-        }
-    except ValueError as e:
-        # Handle API key errors or configuration issues
-        print(f"Gemini API error: Configuration issue (check GEMINI_API_KEY in .env): {e}")
-        return {
-            'category': 'LOW_PRIORITY',
-            'summary': 'Error during analysis (API configuration issue)',
-            'extracted_info': json.dumps({})
-        }
+            logger.error("Gemini API error: Empty response from API")
+            return [_fallback_result('Unable to analyze email (empty response)') for _ in email_contents]
+
+        # Items are validated one by one, so a malformed item only fails its own email
+        items = decode_reply_as(response_text, List[msgspec.Raw])
     except Exception as e:
-        print(f"Gemini API error: Failed to analyze email (error type: {type(e).__name__}, message: {str(e)})")
-        return {
-            'category': 'LOW_PRIORITY',
-            'summary': 'Error during analysis',
-            'extracted_info': json.dumps({})
-        }
+        failure = _failure_result(e)
+        return [failure] + [dict(failure) for _ in range(len(email_contents) - 1)]
+
+    results: List[Optional[Dict]] = [None] * len(email_contents)
+    for position, raw in enumerate(items):
+        try:
+            reply = msgspec.json.decode(raw, type=BatchAnalysisReply, strict=False)
+        except msgspec.DecodeError as e:
+            logger.warning("Gemini API error: Skipping malformed batch item %d: %s", position + 1, e)
+            continue
+        # Place each item by its email_index, falling back to position
+        index = reply.email_index - 1 if reply.email_index is not None else position
+        if 0 <= index < len(results) and results[index] is None:
+            results[index] = _analysis_result(reply)
+
+    missing = results.count(None)
+    if missing:
+        logger.warning("Gemini API error: Batch response was missing %d of %d analyses", missing, len(results))
+    return [result if result is not None else _fallback_result('Unable to analyze email') for result in results]
+
+
+def analyze_emails_batch(email_contents: List[str], user_profile: Dict, batch_size: int = BATCH_SIZE) -> List[Dict]:
+    """
+    Analyze several emails for the same user, sending up to batch_size emails
+    per Gemini request so the persona prompt and round-trip are shared.
+
+    Args:
+        email_contents: The email contents to analyze
+        user_profile: Dictionary containing user's persona data (see analyze_email)
+        batch_size: Maximum number of emails per Gemini request
+
+    Returns:
+        One analysis dict per email, in input order (same shape as analyze_email)
+    """
+    client = get_genai_client()
+    head, tail = _prompt_parts(*_profile_fields(user_profile), batched=True)
+
+    results = []
+    for start in range(0, len(email_contents), batch_size):
+        chunk = email_contents[start:start + batch_size]
+        if len(chunk) == 1:
+            results.append(analyze_email(chunk[0], user_profile))
+        else:
+            results.extend(_analyze_chunk(client, head, tail, chunk))
+    return results
@@ -4,9 +4,12 @@ Focused Gemini 2.5 Flash API test
 """
 
 import sys
-import os
 sys.path.append('.')
 
+from dotenv import load_dotenv
+
+load_dotenv()
+
 def test_gemini_api():
     print('GEMINI 2.5 FLASH API TEST - FOCUSED')
     print('=' * 50)
@@ -4,17 +4,39 @@ Run this script to generate a secure encryption key for your .env file.
 
 Usage:
     python generate_encryption_key.py
+    python generate_encryption_key.py --count 50   # one key per line, for bulk provisioning
 """
-from cryptography.fernet import Fernet
+import os
+import base64
+import argparse
+
+# Fernet keys are 32 random bytes, urlsafe base64-encoded
+KEY_SIZE = 32
+
+
+def generate_keys(count: int) -> list:
+    """Generate count Fernet keys from a single os.urandom call."""
+    random_bytes = os.urandom(KEY_SIZE * count)
+    return [
+        base64.urlsafe_b64encode(random_bytes[start:start + KEY_SIZE]).decode()
+        for start in range(0, KEY_SIZE * count, KEY_SIZE)
+    ]
+
 
 if __name__ == "__main__":
-    key = Fernet.generate_key()
-    print("=" * 60)
-    print("ENCRYPTION KEY GENERATED")
-    print("=" * 60)
-    print("\nAdd this to your .env file:")
-    print(f"ENCRYPTION_KEY={key.decode()}")
-    print("\n" + "=" * 60)
-    print("⚠️  IMPORTANT: Keep this key secure and never commit it to version control!")
-    print("=" * 60)
+    parser = argparse.ArgumentParser(description="Generate Fernet encryption keys.")
+    parser.add_argument("--count", type=int, default=1, help="number of keys to generate")
+    args = parser.parse_args()
 
+    if args.count > 1:
+        print("\n".join(generate_keys(args.count)))
+    else:
+        key = generate_keys(1)[0]
+        print("=" * 60)
+        print("ENCRYPTION KEY GENERATED")
+        print("=" * 60)
+        print("\nAdd this to your .env file:")
+        print(f"ENCRYPTION_KEY={key}")
+        print("\n" + "=" * 60)
+        print("⚠️  IMPORTANT: Keep this key secure and never commit it to version control!")
+        print("=" * 60)
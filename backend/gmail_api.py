@@ -4,16 +4,26 @@ Handles email fetching and sending via Gmail API with multi-user support.
 """
 import os
 import base64
-import json
+import hashlib
+import html
+import re
+import threading
+import time
+import httpx
+import orjson
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
-from datetime import datetime
-from email.utils import parsedate_to_datetime
+from datetime import date
+from email.utils import parsedate_tz
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from googleapiclient.errors import HttpError
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from googleapiclient.model import JsonModel
+from selectolax.lexbor import LexborHTMLParser
 
 # Gmail API scopes
 # Gmail API scopes
@@ -23,9 +33,67 @@ SCOPES = ['https://www.googleapis.com/auth/gmail.readonly',
           'https://www.googleapis.com/auth/userinfo.profile',
           'openid']
 
+# Extra attempts for Gmail reads. The client library retries rate limits,
+# 5xx responses and connection errors itself, with randomized exponential backoff.
+GMAIL_NUM_RETRIES = 2
+
+# messages.get calls per HTTP batch request. Gmail accepts up to 100, but
+# recommends at most 50 to avoid rate limiting inside the batch.
+GMAIL_BATCH_SIZE = 50
+
+# Most ids messages.list returns per page
+GMAIL_LIST_PAGE_SIZE = 500
+
+# Fallback when a batch request fails: plain REST calls, this many at a time
+GMAIL_MESSAGES_URL = 'https://gmail.googleapis.com/gmail/v1/users/me/messages/'
+GMAIL_FALLBACK_WORKERS = 10
+
+# Shared by all users' fallback fetches, so TLS connections to Gmail stay open
+# between scans; credentials go in each request's headers. Over HTTP/2 the
+# concurrent fallback fetches share a connection as multiplexed streams.
+_rest_client = httpx.Client(
+    http2=True,
+    timeout=30,
+    limits=httpx.Limits(max_connections=GMAIL_FALLBACK_WORKERS * 2, max_keepalive_connections=GMAIL_FALLBACK_WORKERS)
+)
+
+# Headers requested when fetching emails with detail_level='metadata'
+GMAIL_METADATA_HEADERS = ['From', 'Subject', 'Date']
+
+# Gmail discovery document, parsed once from the copy bundled with the client
+# library, so building a service never fetches or re-parses it. build_from_document
+# fills in a few defaults on the dict the first time; later builds leave it unchanged.
+_GMAIL_DISCOVERY_DOC = orjson.loads(get_static_doc('gmail', 'v1'))
+
+# Tag stripper for HTML bodies the parser can't handle
+_HTML_TAG_RE = re.compile(r'<[^<]+?>')
+
+
+class _OrjsonModel(JsonModel):
+    """JsonModel that parses Gmail's responses with orjson instead of the json module."""
+
+    def deserialize(self, content):
+        try:
+            body = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return content.decode('utf-8') if isinstance(content, bytes) else content
+        if self._data_wrapper and 'data' in body:
+            body = body['data']
+        return body
+
+
+# Gmail's discovery document declares no dataWrapper feature
+_GMAIL_MODEL = _OrjsonModel(data_wrapper=False)
+
+# Services built from stored credentials are reused for the same credentials_json.
+# The cache is per thread: a service sends requests through httplib2, which isn't
+# thread-safe, so one service must not serve two threads at once.
+SERVICE_CACHE_SIZE = 32
+_service_caches = threading.local()
+
 # Export SCOPES for use in other modules
 __all__ = ['SCOPES', 'get_gmail_service_from_credentials', 'fetch_unread_emails', 
-           'fetch_recent_emails', 'send_email', 'get_user_email']
+           'fetch_recent_emails', 'fetch_new_emails', 'send_email', 'get_user_email']
 
 
 def get_gmail_service_from_credentials(credentials_json: str):
@@ -34,25 +102,46 @@ def get_gmail_service_from_credentials(credentials_json: str):
     Returns tuple (service, updated_credentials_json)
     If no refresh needed, updated_credentials_json is None.
     """
+    service, _, updated_creds_json = _service_from_credentials(credentials_json)
+    return service, updated_creds_json
+
+
+def _service_from_credentials(credentials_json: str):
+    """get_gmail_service_from_credentials, also returning the Credentials: (service, creds, updated_credentials_json)."""
     try:
-        # Parse the credentials JSON
-        creds_dict = json.loads(credentials_json)
-        creds = Credentials.from_authorized_user_info(creds_dict, SCOPES)
+        cache = getattr(_service_caches, 'services', None)
+        if cache is None:
+            cache = _service_caches.services = OrderedDict()
+        key = hashlib.sha256(credentials_json.encode('utf-8')).digest()
+        cached = cache.get(key)
+        if cached is not None:
+            cache.move_to_end(key)
+            service, creds = cached
+        else:
+            # Parse the credentials JSON
+            creds_dict = orjson.loads(credentials_json)
+            creds = Credentials.from_authorized_user_info(creds_dict, SCOPES)
+            service = build_from_document(_GMAIL_DISCOVERY_DOC, credentials=creds, model=_GMAIL_MODEL)
+            cache[key] = (service, creds)
+            if len(cache) > SERVICE_CACHE_SIZE:
+                cache.popitem(last=False)
         
         updated_creds_json = None
         
-        # Refresh if expired
+        # Refresh if expired (google-auth counts a token as expired shortly before it actually is)
         if creds.expired and creds.refresh_token:
             print(f"Credentials expired, refreshing...")
             try:
                 creds.refresh(Request())
                 updated_creds_json = creds.to_json()
+                # Callers store the refreshed JSON and pass it in next time
+                cache[hashlib.sha256(updated_creds_json.encode('utf-8')).digest()] = (service, creds)
                 print(f"Credentials refreshed successfully")
             except Exception as refresh_error:
                 print(f"Failed to refresh credentials: {refresh_error}")
                 # Continue and let the API call fail if refresh failed
         
-        return build('gmail', 'v1', credentials=creds), updated_creds_json
+        return service, creds, updated_creds_json
     except Exception as e:
         print(f"Error creating Gmail service from credentials: {e}")
         raise
@@ -60,6 +149,11 @@ def get_gmail_service_from_credentials(credentials_json: str):
 
 def get_gmail_service():
     """Legacy function for backward compatibility - uses local token.json."""
+    return build_from_document(_GMAIL_DISCOVERY_DOC, credentials=_local_credentials(), model=_GMAIL_MODEL)
+
+
+def _local_credentials() -> Credentials:
+    """Load the local token.json, refreshing it or running the OAuth flow as needed."""
     creds = None
     script_dir = os.path.dirname(os.path.abspath(__file__))
     token_file = os.path.join(script_dir, 'token.json')
@@ -83,14 +177,9 @@ def get_gmail_service():
         with open(token_file, 'w') as token:
             token.write(creds.to_json())
     
-    return build('gmail', 'v1', credentials=creds)
+    return creds
 
 
-@retry(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=4, max=10),
-    retry=retry_if_exception_type((HttpError, ConnectionError))
-)
 def fetch_unread_emails(credentials_json: Optional[str] = None, limit: int = 20) -> tuple[List[Dict], Optional[str]]:
     """
     Fetch unread emails from Gmail. Uses credentials_json if provided, otherwise falls back to file-based.
@@ -99,25 +188,15 @@ def fetch_unread_emails(credentials_json: Optional[str] = None, limit: int = 20)
     updated_creds_json = None
     try:
         if credentials_json:
-            service, new_creds = get_gmail_service_from_credentials(credentials_json)
+            service, creds, new_creds = _service_from_credentials(credentials_json)
             if new_creds:
                 updated_creds_json = new_creds
         else:
-            service = get_gmail_service()
+            creds = _local_credentials()
+            service = build_from_document(_GMAIL_DISCOVERY_DOC, credentials=creds, model=_GMAIL_MODEL)
             
-        results = service.users().messages().list(
-            userId='me',
-            q='is:unread',
-            maxResults=limit
-        ).execute()
-        
-        messages = results.get('messages', [])
-        email_list = []
-        
-        for msg in messages:
-            email_data = get_email_details(service, msg['id'])
-            if email_data:
-                email_list.append(email_data)
+        messages = _list_messages(service, 'is:unread', limit)
+        email_list = get_email_details_batch(service, [msg['id'] for msg in messages], credentials=creds)
         
         return email_list, updated_creds_json
     except HttpError as error:
@@ -128,9 +207,80 @@ def fetch_unread_emails(credentials_json: Optional[str] = None, limit: int = 20)
         return [], updated_creds_json
 
 
-def fetch_recent_emails(credentials_json: Optional[str] = None, limit: int = 100, days: float = 7) -> tuple[List[Dict], Optional[str]]:
+def _iter_message_pages(service, query: str, limit: int):
+    """Yield pages of messages.list entries matching query, following nextPageToken until limit ids."""
+    page_token = None
+    remaining = limit
+    while remaining > 0:
+        results = service.users().messages().list(
+            userId='me',
+            q=query,
+            maxResults=min(remaining, GMAIL_LIST_PAGE_SIZE),
+            pageToken=page_token
+        ).execute(num_retries=GMAIL_NUM_RETRIES)
+        page = results.get('messages', [])[:remaining]
+        if page:
+            yield page
+        remaining -= len(page)
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+
+
+def _list_messages(service, query: str, limit: int) -> List[Dict]:
+    """Up to limit messages.list entries matching query, across as many pages as needed."""
+    return [message for page in _iter_message_pages(service, query, limit) for message in page]
+
+
+def _list_recent_messages(service, limit: int, days: float, logger) -> List[Dict]:
+    """
+    List the ids of recent inbox/sent messages from the last N days, widening
+    the search when nothing matches. Returns messages.list entries ({'id', 'threadId'}).
+    """
+    # Build a more inclusive query
+    # Search in inbox AND sent to catch all emails user might care about
+    if days > 0:
+        # Epoch seconds give an exact cutoff; a YYYY/MM/DD date would round fractional days to midnight
+        date_cutoff = int(time.time() - days * 86400)
+        # Search in inbox and sent folders, after the date cutoff
+        query = f'(in:inbox OR in:sent) after:{date_cutoff}'
+        logger.info(f"[Gmail API] Fetching emails with query: '{query}', maxResults: {limit}")
+    else:
+        # No date restriction - get most recent emails from Inbox/Sent
+        query = 'in:inbox OR in:sent'
+        logger.info(f"[Gmail API] Fetching recent emails without date filter, maxResults: {limit}")
+
+    messages = _list_messages(service, query, limit)
+    logger.info(f"[Gmail API] Query returned {len(messages)} message(s)")
+
+    if len(messages) == 0:
+        logger.warning(f"[Gmail API] No messages found using primary query!")
+
+        # FALLBACK 1: Try searching ALL mail (folders) if query had date
+        if days > 0:
+            logger.info(f"[Gmail API] Attempting fallback: Search ALL mail after {date_cutoff}")
+            fallback_query = f'after:{date_cutoff}'
+            messages = _list_messages(service, fallback_query, limit)
+            logger.info(f"[Gmail API] Date fallback returned {len(messages)} message(s)")
+
+        # FALLBACK 2: If still no emails, try fetching absolute latest emails from inbox without date
+        if len(messages) == 0 and days > 0:
+             logger.info(f"[Gmail API] Attempting ultimate fallback: Latest inbox emails (no date limit)")
+             fallback_query = 'in:inbox'
+             results = service.users().messages().list(userId='me', q=fallback_query, maxResults=min(limit, 10)).execute(num_retries=GMAIL_NUM_RETRIES)
+             messages = results.get('messages', [])
+             logger.info(f"[Gmail API] Ultimate fallback returned {len(messages)} message(s)")
+             if len(messages) > 0:
+                 logger.warning("[Gmail API] Found emails only by ignoring date filter - these may be old!")
+
+    return messages
+
+
+def fetch_recent_emails(credentials_json: Optional[str] = None, limit: int = 100, days: float = 7, detail_level: str = 'full') -> tuple[List[Dict], Optional[str]]:
     """
     Fetch recent emails (read or unread) from the last N days (supports fractional days for hours).
+    detail_level 'metadata' fetches only the From/Subject/Date headers and Gmail's
+    snippet: body is empty and body_preview holds the snippet.
     Returns (email_list, updated_credentials_json)
     """
     import logging
@@ -141,13 +291,14 @@ def fetch_recent_emails(credentials_json: Optional[str] = None, limit: int = 100
     try:
         if credentials_json:
             logger.info(f"[Gmail API] Creating service from credentials (credentials length: {len(credentials_json)} chars)")
-            service, new_creds = get_gmail_service_from_credentials(credentials_json)
+            service, creds, new_creds = _service_from_credentials(credentials_json)
             if new_creds:
                 updated_creds_json = new_creds
                 logger.info(f"[Gmail API] Credentials were refreshed during service creation")
         else:
             logger.info(f"[Gmail API] Using local token.json for credentials")
-            service = get_gmail_service()
+            creds = _local_credentials()
+            service = build_from_document(_GMAIL_DISCOVERY_DOC, credentials=creds, model=_GMAIL_MODEL)
             
         # VERIFY IDENTITY: Log the email address we are scanning
         try:
@@ -159,62 +310,11 @@ def fetch_recent_emails(credentials_json: Optional[str] = None, limit: int = 100
         except Exception as profile_error:
             logger.warning(f"[Gmail API] Could not verify identity: {profile_error}")
 
-        from datetime import datetime, timedelta
-        
-        # Build a more inclusive query
-        # Search in inbox AND sent to catch all emails user might care about
-        if days > 0:
-            date_cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y/%m/%d')
-            # Search in inbox and sent folders, after the date cutoff
-            query = f'(in:inbox OR in:sent) after:{date_cutoff}'
-            logger.info(f"[Gmail API] Fetching emails with query: '{query}', maxResults: {limit}")
-        else:
-            # No date restriction - get most recent emails from Inbox/Sent
-            query = 'in:inbox OR in:sent'
-            logger.info(f"[Gmail API] Fetching recent emails without date filter, maxResults: {limit}")
-        
-        results = service.users().messages().list(
-            userId='me',
-            q=query,
-            maxResults=limit
-        ).execute()
-        
-        messages = results.get('messages', [])
-        logger.info(f"[Gmail API] Query returned {len(messages)} message(s)")
-        
-        if len(messages) == 0:
-            logger.warning(f"[Gmail API] No messages found using primary query!")
-            
-            # FALLBACK 1: Try searching ALL mail (folders) if query had date
-            if days > 0:
-                logger.info(f"[Gmail API] Attempting fallback: Search ALL mail after {date_cutoff}")
-                fallback_query = f'after:{date_cutoff}'
-                results = service.users().messages().list(userId='me', q=fallback_query, maxResults=limit).execute()
-                messages = results.get('messages', [])
-                logger.info(f"[Gmail API] Date fallback returned {len(messages)} message(s)")
-
-            # FALLBACK 2: If still no emails, try fetching absolute latest emails from inbox without date
-            if len(messages) == 0 and days > 0:
-                 logger.info(f"[Gmail API] Attempting ultimate fallback: Latest inbox emails (no date limit)")
-                 fallback_query = 'in:inbox'
-                 results = service.users().messages().list(userId='me', q=fallback_query, maxResults=min(limit, 10)).execute()
-                 messages = results.get('messages', [])
-                 logger.info(f"[Gmail API] Ultimate fallback returned {len(messages)} message(s)")
-                 if len(messages) > 0:
-                     logger.warning("[Gmail API] Found emails only by ignoring date filter - these may be old!")
+        messages = _list_recent_messages(service, limit, days, logger)
         
-        email_list = []
-        
-        for i, msg in enumerate(messages):
-            logger.debug(f"[Gmail API] Fetching details for message {i+1}/{len(messages)} (id: {msg['id'][:20]}...)")
-            email_data = get_email_details(service, msg['id'])
-            if email_data:
-                email_list.append(email_data)
+        email_list = get_email_details_batch(service, [msg['id'] for msg in messages], detail_level, creds)
         
         logger.info(f"[Gmail API] Successfully fetched {len(email_list)} email(s) with full details")
-        if len(email_list) == 0 and not error_occurred: 
-            # If no emails and no error, maybe legitimate empty inbox
-            pass
             
         return email_list, updated_creds_json, None
     except HttpError as error:
@@ -230,75 +330,276 @@ def fetch_recent_emails(credentials_json: Optional[str] = None, limit: int = 100
         return [], updated_creds_json, error_msg
 
 
-def normalize_date(date_str: str) -> str:
-    """Normalize email date to YYYY-MM-DD format."""
+def _history_message_ids(service, start_history_id: str, limit: int) -> List[str]:
+    """
+    Ids of inbox/sent messages added since start_history_id, newest first, at most limit.
+    Raises HttpError 404 if start_history_id is too old for Gmail to replay.
+    """
+    msg_ids = []
+    page_token = None
+    while True:
+        results = service.users().history().list(
+            userId='me',
+            startHistoryId=start_history_id,
+            historyTypes=['messageAdded'],
+            pageToken=page_token
+        ).execute(num_retries=GMAIL_NUM_RETRIES)
+        for record in results.get('history', []):
+            for added in record.get('messagesAdded', []):
+                message = added['message']
+                # Same folders as the messages.list query in _list_recent_messages
+                labels = message.get('labelIds', [])
+                if 'INBOX' in labels or 'SENT' in labels:
+                    msg_ids.append(message['id'])
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+    # History is oldest first; a message can appear in more than one record
+    return list(dict.fromkeys(reversed(msg_ids)))[:limit]
+
+
+def fetch_new_emails(credentials_json: Optional[str], start_history_id: Optional[str], limit: int = 100, days: float = 7, detail_level: str = 'full') -> tuple:
+    """
+    Fetch only the emails added since start_history_id, using Gmail's history API
+    instead of re-listing the last N days. Without a start_history_id, or when Gmail
+    no longer has history that old, falls back to the fetch_recent_emails listing.
+    Store the returned history_id and pass it back in as start_history_id next time.
+    Returns (email_list, updated_credentials_json, history_id, error_msg)
+    """
+    import logging
+    logger = logging.getLogger("uvicorn")
+
+    updated_creds_json = None
+
+    try:
+        if credentials_json:
+            service, creds, updated_creds_json = _service_from_credentials(credentials_json)
+        else:
+            creds = _local_credentials()
+            service = build_from_document(_GMAIL_DISCOVERY_DOC, credentials=creds, model=_GMAIL_MODEL)
+
+        # Read the mailbox position before listing, so nothing that arrives meanwhile is skipped next time
+        history_id = service.users().getProfile(userId='me').execute(num_retries=GMAIL_NUM_RETRIES).get('historyId')
+
+        msg_ids = None
+        if start_history_id:
+            try:
+                msg_ids = _history_message_ids(service, start_history_id, limit)
+                logger.info(f"[Gmail API] History since {start_history_id} has {len(msg_ids)} new message(s)")
+            except HttpError as error:
+                if error.resp.status != 404:
+                    raise
+                logger.warning(f"[Gmail API] History {start_history_id} has expired, re-listing recent emails")
+        if msg_ids is None:
+            msg_ids = [msg['id'] for msg in _list_recent_messages(service, limit, days, logger)]
+
+        return get_email_details_batch(service, msg_ids, detail_level, creds), updated_creds_json, history_id, None
+    except HttpError as error:
+        error_msg = f'Gmail API HttpError: {error.resp.status if hasattr(error, "resp") else "unknown"} - {str(error)}'
+        logger.error(error_msg)
+        return [], updated_creds_json, None, error_msg
+    except Exception as e:
+        error_msg = f'Gmail API Error: {type(e).__name__}: {str(e)}'
+        logger.error(error_msg)
+        return [], updated_creds_json, None, error_msg
+
+
+def normalize_date(date_str: str, today: Optional[str] = None) -> str:
+    """
+    Normalize email date to YYYY-MM-DD format, or to today's date if it can't be parsed.
+    Pass today (YYYY-MM-DD) when normalizing many dates to skip reading the clock for each.
+    """
     try:
         if date_str:
-            dt = parsedate_to_datetime(date_str)
-            return dt.strftime('%Y-%m-%d')
+            # The parsed fields are already in the header's own timezone; date() rejects impossible days
+            parsed = parsedate_tz(date_str)
+            if parsed:
+                return date(*parsed[:3]).isoformat()
     except:
         pass
-    return datetime.now().strftime('%Y-%m-%d')
+    return today or date.today().isoformat()
 
 
-def get_email_details(service, msg_id: str) -> Optional[Dict]:
-    """Get detailed information about a specific email."""
-    try:
-        message = service.users().messages().get(userId='me', id=msg_id, format='full').execute()
-        
-        headers = message['payload'].get('headers', [])
-        
-        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-        sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
-        date_raw = next((h['value'] for h in headers if h['name'] == 'Date'), '')
-        date_normalized = normalize_date(date_raw)
-        
+def _message_params(detail_level: str) -> Dict:
+    """messages.get parameters for a detail level ('full' or 'metadata')."""
+    if detail_level == 'metadata':
+        return {'format': 'metadata', 'metadataHeaders': GMAIL_METADATA_HEADERS}
+    return {'format': 'full'}
+
+
+def _email_from_message(message: Dict, msg_id: str, detail_level: str = 'full', today: Optional[str] = None) -> Dict:
+    """Build the email dict from a messages.get response (full or metadata)."""
+    # One pass over the headers; built in reverse so a repeated header keeps its first value
+    headers = {h['name']: h['value'] for h in reversed(message['payload'].get('headers', []))}
+    
+    subject = headers.get('Subject', 'No Subject')
+    sender = headers.get('From', 'Unknown')
+    date_raw = headers.get('Date', '')
+    date_normalized = normalize_date(date_raw, today)
+    
+    if detail_level == 'metadata':
+        # No body parts in a metadata response, only Gmail's HTML-escaped snippet
+        body = ''
+        body_preview = html.unescape(message.get('snippet', ''))
+    else:
         body = extract_body(message['payload'])
         body_preview = body[:500] if body else ''
-        
-        return {
-            'msg_id': msg_id,
-            'sender': sender,
-            'subject': subject,
-            'body': body,
-            'body_preview': body_preview,
-            'date': date_normalized,
-            'date_raw': date_raw
-        }
+    
+    return {
+        'msg_id': msg_id,
+        'sender': sender,
+        'subject': subject,
+        'body': body,
+        'body_preview': body_preview,
+        'date': date_normalized,
+        'date_raw': date_raw
+    }
+
+
+def _parse_email(message: Dict, msg_id: str, detail_level: str = 'full', today: Optional[str] = None) -> Optional[Dict]:
+    """_email_from_message for one fetched message; a message that can't be parsed is reported and skipped."""
+    try:
+        return _email_from_message(message, msg_id, detail_level, today)
+    except Exception as e:
+        print(f'Gmail API error: Failed to parse email (msg_id: {msg_id[:20]}..., error: {type(e).__name__}: {e})')
+        return None
+
+
+def get_email_details(service, msg_id: str, detail_level: str = 'full') -> Optional[Dict]:
+    """Get detailed information about a specific email."""
+    try:
+        message = service.users().messages().get(userId='me', id=msg_id, **_message_params(detail_level)).execute(num_retries=GMAIL_NUM_RETRIES)
+        return _parse_email(message, msg_id, detail_level)
     except HttpError as error:
         print(f'Gmail API error: Failed to fetch email details (msg_id: {msg_id[:20]}..., error code: {error.resp.status if hasattr(error, "resp") else "unknown"})')
         return None
 
 
+def _get_email_details_concurrent(credentials: Credentials, msg_ids: List[str], detail_level: str = 'full', today: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    Fetch emails with one REST call each, GMAIL_FALLBACK_WORKERS in flight at once,
+    authorized with the credentials' access token (refreshed first if it has expired).
+    Returns {msg_id: email} for the ones fetched.
+    """
+    if not credentials.valid:
+        try:
+            credentials.refresh(Request())
+        except Exception as refresh_error:
+            print(f"Failed to refresh credentials: {refresh_error}")
+            return {}
+    headers = {'Authorization': f'Bearer {credentials.token}'}
+    params = _message_params(detail_level)
+
+    def fetch(msg_id: str) -> Optional[Dict]:
+        try:
+            response = _rest_client.get(GMAIL_MESSAGES_URL + msg_id, params=params, headers=headers)
+        except httpx.HTTPError as error:
+            print(f'Gmail API error: Failed to fetch email details (msg_id: {msg_id[:20]}..., error: {type(error).__name__})')
+            return None
+        if response.status_code != 200:
+            print(f'Gmail API error: Failed to fetch email details (msg_id: {msg_id[:20]}..., error code: {response.status_code})')
+            return None
+        return _parse_email(orjson.loads(response.content), msg_id, detail_level, today)
+
+    with ThreadPoolExecutor(max_workers=GMAIL_FALLBACK_WORKERS) as pool:
+        fetched = dict(zip(msg_ids, pool.map(fetch, msg_ids)))
+    return {msg_id: email_data for msg_id, email_data in fetched.items() if email_data}
+
+
+def get_email_details_batch(service, msg_ids: List[str], detail_level: str = 'full', credentials: Optional[Credentials] = None) -> List[Dict]:
+    """
+    Get detailed information about several emails, GMAIL_BATCH_SIZE messages.get
+    calls per HTTP batch request instead of one round-trip each.
+    Messages that fail with a rate limit or server error are retried one by one;
+    other failures are skipped. If a whole batch request fails, its messages
+    are fetched concurrently with the service's credentials instead, or one by
+    one when they aren't passed. Returns the emails in msg_ids order, each once.
+    """
+    details = {}
+    # Ids to fetch again one by one; a dict keeps them ordered and unique
+    retry_ids = {}
+    # Ids the batch responded to, whether fetched, failed or queued for a retry
+    answered = set()
+    # Fallback date for messages without a parseable Date header
+    today = date.today().isoformat()
+
+    def on_message(request_id, response, exception):
+        answered.add(request_id)
+        if exception is None:
+            email_data = _parse_email(response, request_id, detail_level, today)
+            if email_data:
+                details[request_id] = email_data
+            return
+        status = exception.resp.status if isinstance(exception, HttpError) else None
+        if status == 429 or (status is not None and status >= 500):
+            retry_ids[request_id] = None
+        else:
+            print(f'Gmail API error: Failed to fetch email details (msg_id: {request_id[:20]}..., error code: {status or "unknown"})')
+
+    params = _message_params(detail_level)
+    # A batch rejects repeated request ids, and each message only needs fetching once
+    unique_ids = list(dict.fromkeys(msg_ids))
+    for start in range(0, len(unique_ids), GMAIL_BATCH_SIZE):
+        chunk = unique_ids[start:start + GMAIL_BATCH_SIZE]
+        batch = service.new_batch_http_request(callback=on_message)
+        for msg_id in chunk:
+            batch.add(service.users().messages().get(userId='me', id=msg_id, **params), request_id=msg_id)
+        try:
+            batch.execute()
+        except Exception as e:
+            # Skip messages the batch already answered, including those queued for a retry
+            missing_ids = [msg_id for msg_id in chunk if msg_id not in answered]
+            print(f'Gmail API error: Batch request failed ({type(e).__name__}), fetching {len(missing_ids)} message(s) individually')
+            if credentials is not None:
+                details.update(_get_email_details_concurrent(credentials, missing_ids, detail_level, today))
+            else:
+                retry_ids.update(dict.fromkeys(missing_ids))
+
+    for msg_id in retry_ids:
+        email_data = get_email_details(service, msg_id, detail_level)
+        if email_data:
+            details[msg_id] = email_data
+
+    return [details[msg_id] for msg_id in unique_ids if msg_id in details]
+
+
+def _html_to_text(html_body: str) -> str:
+    """
+    Convert an HTML email body to plain text: tags, scripts and styles dropped,
+    entities decoded. Falls back to stripping tags with a regex if parsing fails.
+    """
+    try:
+        tree = LexborHTMLParser(html_body)
+        tree.strip_tags(['script', 'style'])
+        return tree.text(separator=' ', strip=True)
+    except Exception:
+        return _HTML_TAG_RE.sub('', html_body)
+
+
 def extract_body(payload) -> str:
-    """Extract email body from payload."""
-    body = ""
-    
-    if 'parts' in payload:
-        for part in payload['parts']:
-            if part['mimeType'] == 'text/plain':
-                data = part['body'].get('data')
-                if data:
-                    body += base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
-            elif part['mimeType'] == 'text/html':
-                data = part['body'].get('data')
-                if data:
-                    html_body = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
-                    import re
-                    body += re.sub('<[^<]+?>', '', html_body)
-    else:
-        if payload['mimeType'] == 'text/plain':
-            data = payload['body'].get('data')
+    """
+    Extract email body from payload. HTML parts are only converted when the
+    message has no plain text: in multipart/alternative mail the HTML part
+    repeats the text part, and converting it is the costly step.
+    """
+    # A single-part message is its own only part
+    parts = payload['parts'] if 'parts' in payload else (payload,)
+    texts = []
+    html_parts = []
+    for part in parts:
+        if part['mimeType'] == 'text/plain':
+            data = part['body'].get('data')
             if data:
-                body = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
-        elif payload['mimeType'] == 'text/html':
-            data = payload['body'].get('data')
+                texts.append(base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore'))
+        elif part['mimeType'] == 'text/html':
+            data = part['body'].get('data')
             if data:
-                html_body = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
-                import re
-                body = re.sub('<[^<]+?>', '', html_body)
-    
-    return body
+                html_parts.append(data)
+    if not texts:
+        for data in html_parts:
+            html_body = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
+            texts.append(_html_to_text(html_body))
+    return ''.join(texts)
 
 
 def send_email(credentials_json: Optional[str], to: str, subject: str, body: str):
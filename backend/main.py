@@ -3,8 +3,10 @@ Briefly - AI Email Analyst SaaS API
 FastAPI backend for email analysis and briefing with multi-user support.
 """
 import os
-import json
+import queue
+import orjson
 import logging
+import logging.handlers
 
 # Configure logging
 logging.basicConfig(
@@ -17,9 +19,15 @@ from typing import List, Dict, Optional
 from enum import Enum
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from fastapi import FastAPI, HTTPException, Request as FastAPIRequest, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
+
+# Load environment variables once for the whole app, before importing the
+# modules below (encryption reads ENCRYPTION_KEY at import time)
+load_dotenv()
+
 from supabase import create_client, Client
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
@@ -31,9 +39,6 @@ import gemini_ai
 import models
 import deal_flow_classifier
 
-# Load environment variables
-load_dotenv()
-
 # Initialize FastAPI app
 app = FastAPI(title="Briefly API", version="1.0.0")
 
@@ -63,6 +68,10 @@ if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
+# Create the shared Gemini client up front so the first analysis doesn't pay for it
+if os.getenv("GEMINI_API_KEY"):
+    gemini_ai.get_genai_client()
+
 # Initialize background scheduler
 scheduler = BackgroundScheduler()
 scheduler.start()
@@ -358,16 +367,11 @@ def daily_briefing_job():
                     logger.warning(f"[Daily Briefing Job] User {user_id} has no profile, skipping")
                     continue
 
-                # Get keywords and role from profile
+                # Get keywords from profile
                 keywords = profile.get('keywords', [])
                 if isinstance(keywords, str):
                     # If stored as comma-separated string, convert to list
                     keywords = [k.strip() for k in keywords.split(',') if k.strip()]
-                user_role_str = profile.get('role', 'Investor')
-                try:
-                    user_role = UserRole(user_role_str)
-                except ValueError:
-                    user_role = UserRole.INVESTOR  # Default
 
                 # Decrypt credentials and process emails
                 credentials_json = models.get_google_credentials(supabase, user_id)
@@ -376,15 +380,25 @@ def daily_briefing_job():
                     logger.error(f"[Daily Briefing Job] Could not decrypt credentials for user {user_id}")
                     continue
 
-                # Fetch recent emails from last 24 hours (not just unread)
-                # This ensures we catch all emails from the past day for the "Chief of Staff" automation
-                emails = gmail_api.fetch_recent_emails(
-                    credentials_json=credentials_json,
+                # Fetch the emails that arrived since the last run (not just unread).
+                # The first run, or one after Gmail's history has expired, scans the last 24 hours instead.
+                emails, updated_creds, history_id, error_msg = gmail_api.fetch_new_emails(
+                    credentials_json,
+                    profile.get('gmail_history_id'),
                     limit=50,  # Increased limit for 24h scan
                     days=1  # Last 24 hours
                 )
 
+                if updated_creds:
+                    models.save_google_credentials(supabase, user_id, updated_creds)
+
+                if error_msg:
+                    logger.error(f"[Daily Briefing Job] Could not fetch emails for user {user_id}: {error_msg}")
+                    continue
+
                 if not emails:
+                    if history_id:
+                        models.save_gmail_history_id(supabase, user_id, history_id)
                     logger.info(f"[Daily Briefing Job] No unread emails for user {user_id}")
                     continue
 
@@ -409,6 +423,9 @@ def daily_briefing_job():
 
                 logger.info(f"[Daily Briefing Job] User {user_id}: Processed {processed_count} emails")
 
+                if history_id:
+                    models.save_gmail_history_id(supabase, user_id, history_id)
+
             except Exception as e:
                 logger.error(f"[Daily Briefing Job] Error processing user {user_id}: {e}")
                 continue
@@ -807,6 +824,15 @@ async def save_credentials(request: SaveCredentialsRequest):
         raise HTTPException(status_code=500, detail=f"Error saving credentials: {str(e)}")
 
 
+# Style-specific instructions for drafted replies
+STYLE_INSTRUCTIONS = {
+    'Short & Direct': 'Write a brief, direct response focusing on key points only. Be concise and to-the-point.',
+    'Polite & Professional': 'Write a courteous, professional response with proper etiquette and formal language.',
+    'Friendly & Casual': 'Write a warm, approachable response with a conversational tone.',
+    'Detailed & Thorough': 'Write a comprehensive response covering all relevant details and providing complete information.'
+}
+
+
 @app.post("/api/draft-reply", response_model=DraftReplyResponse)
 async def draft_reply(request: DraftReplyRequest):
     """
@@ -824,15 +850,7 @@ async def draft_reply(request: DraftReplyRequest):
         communication_style = profile.get('communication_style', 'Professional')
         business_context = profile.get('business_context', '')
 
-        # Style-specific instructions
-        style_instructions = {
-            'Short & Direct': 'Write a brief, direct response focusing on key points only. Be concise and to-the-point.',
-            'Polite & Professional': 'Write a courteous, professional response with proper etiquette and formal language.',
-            'Friendly & Casual': 'Write a warm, approachable response with a conversational tone.',
-            'Detailed & Thorough': 'Write a comprehensive response covering all relevant details and providing complete information.'
-        }
-
-        instructions = style_instructions.get(communication_style, 'Write a professional response.')
+        instructions = STYLE_INSTRUCTIONS.get(communication_style, 'Write a professional response.')
 
         # Create prompt for Gemini to draft a reply
         prompt = f"""You are drafting an email reply for a {role}.
@@ -1268,8 +1286,12 @@ async def get_unscanned_emails(user_id: str):
         if not credentials_json:
             return {"count": 0, "preview": []}
 
-        # Fetch recent unread emails (last 24 hours only for unscanned alerts to keep it recent)
-        emails, updated_creds, error_msg = gmail_api.fetch_recent_emails(credentials_json=credentials_json, limit=50, days=1)
+        # Fetch recent unread emails (last 24 hours only for unscanned alerts to keep it recent).
+        # Only headers and Gmail's snippet are needed for the preview, not the bodies.
+        # The Gmail client blocks, so it runs in the threadpool instead of on the event loop.
+        emails, updated_creds, error_msg = await run_in_threadpool(
+            gmail_api.fetch_recent_emails, credentials_json=credentials_json, limit=50, days=1, detail_level='metadata'
+        )
 
         if updated_creds:
              models.save_google_credentials(supabase, user_id, updated_creds)
@@ -1287,7 +1309,7 @@ async def get_unscanned_emails(user_id: str):
                 'subject': email.get('subject', 'No Subject'),
                 'sender': email.get('sender', 'Unknown'),
                 'date': email.get('date', ''),
-                'snippet': email.get('body', '')[:100] + '...' if len(email.get('body', '')) > 100 else email.get('body', '')
+                'snippet': email.get('body_preview', '')[:100] + '...' if len(email.get('body_preview', '')) > 100 else email.get('body_preview', '')
             })
 
         return {"count": count, "preview": preview}
@@ -1626,21 +1648,21 @@ def check_credentials(user_id: str):
         
         # Try to refresh credentials to check if they're valid
         try:
-            creds_dict = json.loads(credentials_json)
+            creds_dict = orjson.loads(credentials_json)
             creds = Credentials.from_authorized_user_info(creds_dict, gmail_api.SCOPES)
             
             # Refresh if expired
             if creds.expired and creds.refresh_token:
                 creds.refresh(GoogleAuthRequest())
                 # Update stored credentials with refreshed token
-                updated_credentials = json.dumps({
+                updated_credentials = orjson.dumps({
                     'token': creds.token,
                     'refresh_token': creds.refresh_token,
                     'token_uri': creds.token_uri,
                     'client_id': creds.client_id,
                     'client_secret': creds.client_secret,
                     'scopes': creds.scopes,
-                })
+                }).decode()
                 models.save_google_credentials(supabase, user_id, updated_credentials)
             
             return {"connected": True, "valid": True}
@@ -1716,7 +1738,7 @@ def oauth_callback(request: OAuthCallbackRequest):
                 'scopes': credentials.scopes,
             }
             
-            credentials_json = json.dumps(credentials_dict)
+            credentials_json = orjson.dumps(credentials_dict).decode()
             
             # Save credentials
             success = models.save_google_credentials(supabase, request.user_id, credentials_json)
@@ -2340,7 +2362,6 @@ async def flutterwave_webhook(request: FastAPIRequest):
     try:
         import hmac
         import hashlib
-        import json
         
         # Get Flutterwave webhook secret from environment
         flutterwave_secret_hash = os.getenv("FLUTTERWAVE_SECRET_HASH", "")
@@ -2362,11 +2383,11 @@ async def flutterwave_webhook(request: FastAPIRequest):
                 (body_str + flutterwave_secret_hash).encode()
             ).hexdigest()
             
-            if signature != expected_hash:
+            if not hmac.compare_digest(signature.encode(), expected_hash.encode()):
                 raise HTTPException(status_code=400, detail="Invalid signature")
         
         # Parse event data
-        event = json.loads(body_str)
+        event = orjson.loads(body)
         
         # Flutterwave event structure
         event_type = event.get("event")
@@ -2503,8 +2524,30 @@ async def root():
     return {"message": "Briefly API is running", "status": "ok"}
 
 
+# Listeners that write queued log records on background threads
+_log_listeners = []
+
+
+@app.on_event("startup")
+async def startup_event():
+    """
+    Hand log records to background threads, so request handlers and analysis
+    workers never block on console writes. Covers our root handlers and the
+    handlers uvicorn installed on its own logger.
+    """
+    for target in (logging.getLogger(), logging.getLogger("uvicorn")):
+        if target.handlers:
+            log_queue = queue.SimpleQueue()
+            listener = logging.handlers.QueueListener(log_queue, *target.handlers, respect_handler_level=True)
+            target.handlers = [logging.handlers.QueueHandler(log_queue)]
+            listener.start()
+            _log_listeners.append(listener)
+
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Shutdown scheduler when app shuts down."""
     scheduler.shutdown()
+    for listener in _log_listeners:
+        listener.stop()
     return {"message": "Briefly API is running", "status": "ok"}
@@ -50,6 +50,16 @@ def get_google_credentials(supabase: Client, user_id: str) -> Optional[str]:
         print(f"Error getting Google credentials: {e}")
         return None
 
+def save_gmail_history_id(supabase: Client, user_id: str, history_id: str):
+    """Save the Gmail historyId the next incremental sync starts from (read back via get_user_profile)."""
+    try:
+        supabase.table('profiles').update({
+            'gmail_history_id': history_id,
+            'updated_at': datetime.now(timezone.utc).isoformat()
+        }).eq('id', user_id).execute()
+    except Exception as e:
+        print(f"Error saving Gmail history id: {e}")
+
 def get_all_users_with_credentials(supabase: Client) -> List[Dict]:
     """Get all users who have Google credentials stored."""
     try:
@@ -4,7 +4,6 @@ Test script for document analysis feature
 """
 
 import sys
-import os
 sys.path.append('.')
 
 from deal_flow_classifier import classify_email_dual_pipeline
@@ -4,7 +4,6 @@ Comprehensive test for Gemini 2.5 Flash API integration
 """
 
 import sys
-import os
 sys.path.append('.')
 
 from deal_flow_classifier import classify_email_dual_pipeline
@@ -5,7 +5,6 @@ Tests that the AI correctly identifies priority based on intent and persona, not
 """
 import sys
 import os
-import json
 import io
 # Fix for windows terminal emoji printing
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
@@ -0,0 +1,9 @@
+-- Migration: Add gmail_history_id to profiles table
+-- Run this in your Supabase SQL Editor
+
+-- Gmail mailbox position (historyId) reached by the last daily briefing scan.
+-- The next scan fetches only messages added after it via history.list.
+ALTER TABLE public.profiles
+ADD COLUMN IF NOT EXISTS gmail_history_id TEXT;
+
+COMMENT ON COLUMN public.profiles.gmail_history_id IS 'Gmail historyId the next incremental email sync starts from';